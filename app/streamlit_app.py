@@ -1,171 +1,158 @@
-import os
+import sys
 import json
+import hashlib
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
 import streamlit as st
 from neo4j import GraphDatabase
-from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `backend`
+from backend.config import get_settings
+from backend.rag.common import (
+    add_clean_text,
+    build_context_block,
+    vector_search_chunks,
+    vector_search_parts,
+    vector_search_products,
+)
+
+
+@st.cache_resource(show_spinner=False)
+def load_settings():
+    # parsed once per process, shared with the backend modules
+    return get_settings()
+
+
+@st.cache_resource(show_spinner=False)
+def get_driver(env):
+    # one pooled driver for the whole app; never closed per query
+    return GraphDatabase.driver(
+        env.NEO4J_URI,
+        auth=(env.NEO4J_USER, env.NEO4J_PASSWORD),
+        max_connection_pool_size=20,
+        keep_alive=True,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_groq_client(env):
+    # one client with a keep-alive connection pool, reused across reruns
+    import httpx
+    from groq import Groq
+    return Groq(
+        api_key=env.GROQ_API_KEY,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=30)
+        ),
+    )
 
-def load_env():
-    load_dotenv()
-    return {
-        "NEO4J_URI": os.getenv("NEO4J_URI"),
-        "NEO4J_USER": os.getenv("NEO4J_USER"),
-        "NEO4J_PASSWORD": os.getenv("NEO4J_PASSWORD"),
-        "EMBEDDING_BACKEND": os.getenv("EMBEDDING_BACKEND", "sentence-transformers"),
-        "EMBEDDING_MODEL": os.getenv("EMBEDDING_MODEL", "thenlper/gte-small"),
-        "GROQ_API_KEY": os.getenv("GROQ_API_KEY"),
-        "GROQ_CHAT_MODEL": os.getenv("GROQ_CHAT_MODEL", "llama-3.3-70b-versatile"),
-    }
 
 @st.cache_resource(show_spinner=False)
 def get_embedder(env):
-    backend = env["EMBEDDING_BACKEND"]
-    model = env["EMBEDDING_MODEL"]
-    if backend == "sentence-transformers":
-        from sentence_transformers import SentenceTransformer
-        st_model = SentenceTransformer(model)
+    embed = _get_encoder(env)
+    if not env.EMBEDDING_CACHE_PATH:
+        return embed
+
+    # same on-disk cache as ingestion, so repeated questions survive restarts
+    from backend.embeddings_cache import get_or_embed
+    def _cached(texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        return get_or_embed(texts, embed)
+    return _cached
+
+
+def _get_encoder(env):
+    backend = env.EMBEDDING_BACKEND
+    model = env.EMBEDDING_MODEL
+    if backend in ("sentence-transformers", "onnx"):
+        # the backend's process-wide encoder; "onnx" runs the int8 export
+        # from scripts/export_onnx.py on ONNX Runtime
+        from backend.embeddings import get_model
+        st_model = get_model()
         def _embed(texts):
             if isinstance(texts, str):
                 texts = [texts]
-            vecs = st_model.encode(texts, normalize_embeddings=True)
-            return [v.tolist() for v in vecs]
+            return st_model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
         return _embed
     elif backend == "groq":
-        from groq import Groq
-        client = Groq(api_key=env["GROQ_API_KEY"])
+        client = get_groq_client(env)
         def _embed(texts):
             if isinstance(texts, str):
                 texts = [texts]
             resp = client.embeddings.create(model=model, input=texts, encoding_format="float")
-            return [d.embedding for d in resp.data]
+            vecs = np.asarray([d.embedding for d in resp.data], dtype=np.float32)
+            # unit-normalize like the sentence-transformers branch and ingestion
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            return vecs
         return _embed
     else:
         raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
 
 
-def vector_search_chunks(session, q_vec, k, scope):
-    filter_clause = ""
-    if scope == "part":
-        filter_clause = "WHERE x:Part"
-    elif scope == "product":
-        filter_clause = "WHERE x:Product"
-    cypher = f"""
-    CALL db.index.vector.queryNodes('chunk_embedding_index', $k, $q)
-    YIELD node, score
-    MATCH (node)<-[:HAS_CHUNK]-(d:Document)-[:DESCRIBES]->(x)
-    {filter_clause}
-    OPTIONAL MATCH (x)-[:HAS_SPEC]->(s:Spec)
-    WITH node, score, d, x, collect({{key:s.key, value:s.value, unit:s.unit, note:s.note}}) AS specs
-    RETURN
-      node.text AS text,
-      score,
-      CASE WHEN x:Part THEN x.part_id ELSE coalesce(x.sku, x.name, 'PRODUCT') END AS part_id,
-      x.name AS part_name,
-      CASE WHEN x:Part THEN coalesce(x.category, 'Part') ELSE 'Product' END AS category,
-      specs,
-      d.name AS doc_name,
-      d.source AS source
-    ORDER BY score DESC
-    LIMIT $k
-    """
-    result = session.run(cypher, q=q_vec, k=k)
-    return [r.data() for r in result]
-
-def vector_search_parts(session, q_vec, k):
-    cypher = """
-    CALL db.index.vector.queryNodes('part_embedding_index', $k, $q)
-    YIELD node, score
-    OPTIONAL MATCH (node)-[:HAS_SPEC]->(s:Spec)
-    WITH node, score, collect({key:s.key, value:s.value, unit:s.unit, note:s.note}) AS specs
-    RETURN
-      coalesce(node.description,'') AS text,
-      score,
-      node.part_id AS part_id,
-      node.name AS part_name,
-      coalesce(node.category,'Part') AS category,
-      specs,
-      'Part Description' AS doc_name,
-      'part' AS source
-    ORDER BY score DESC
-    LIMIT $k
-    """
-    result = session.run(cypher, q=q_vec, k=k)
-    return [r.data() for r in result]
-
-def vector_search_products(session, q_vec, k):
-    """
-    Optional product fallback (requires product_embedding_index in Neo4j).
-    """
-    if "modulathe" in q.lower():
-        filter_clause = "WHERE x:Product AND toLower(x.name) CONTAINS 'modulathe'"
-    cypher = """
-    CALL db.index.vector.queryNodes('product_embedding_index', $k, $q)
-    YIELD node, score
-    OPTIONAL MATCH (node)-[:HAS_SPEC]->(s:Spec)
-    WITH node, score, collect({key:s.key, value:s.value, unit:s.unit, note:s.note}) AS specs
-    RETURN
-      coalesce(node.description,'') AS text,
-      score,
-      coalesce(node.sku, node.name, 'PRODUCT') AS part_id,
-      node.name AS part_name,
-      'Product' AS category,
-      specs,
-      'Product Description' AS doc_name,
-      'product' AS source
-    ORDER BY score DESC
-    LIMIT $k
-    """
-    result = session.run(cypher, q=q_vec, k=k)
-    return [r.data() for r in result]
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def cached_embed(env, question):
+    # identical questions across reruns skip re-encoding
+    return get_embedder(env)(question)[0]
 
 
 def synthesize(env, question, contexts):
-    if not env["GROQ_API_KEY"]:
+    if not env.GROQ_API_KEY:
         return None
-    from groq import Groq
-    client = Groq(api_key=env["GROQ_API_KEY"])
-
-    def format_specs(specs):
-        if not specs:
-            return ""
-        parts = []
-        for s in specs:
-            k = s.get("key")
-            if not k:
-                continue
-            v = s.get("value") or ""
-            u = s.get("unit") or ""
-            parts.append(f"{k}={v}{u}")
-        return ", ".join(parts)
-
-    blocks = []
-    for i, c in enumerate(contexts, 1):
-        header = f"[{i}] {c.get('category')}: {c.get('part_name')} ({c.get('part_id')})"
-        sp = format_specs(c.get("specs"))
-        if sp:
-            header += f"\nSpecs: {sp}"
-        chunk = (c.get("text") or "").replace("\n", " ").strip()
-        block = f"{header}\nDoc: {c.get('doc_name')} ({c.get('source')})\nChunk: {chunk}"
-        blocks.append(block)
+    client = get_groq_client(env)
 
     messages = [
         {"role": "system", "content": "Answer using ONLY the provided context; if unknown, say you don't know."},
-        {"role": "user", "content": f"Question: {question}\n\nContext:\n" + "\n\n".join(blocks) + "\n\nAnswer:"}
+        {"role": "user", "content": f"Question: {question}\n\nContext:\n" + build_context_block(contexts) + "\n\nAnswer:"}
     ]
     resp = client.chat.completions.create(
-        model=env["GROQ_CHAT_MODEL"],
+        model=env.GROQ_CHAT_MODEL,
         messages=messages,
         temperature=0
     )
     return resp.choices[0].message.content.strip()
 
 
+def context_key(contexts):
+    """Fingerprint of the retrieved context (ids + chunk text, in prompt order)."""
+    h = hashlib.blake2b(digest_size=16)
+    for c in contexts:
+        h.update(str(c.get("part_id")).encode())
+        h.update(b"\0")
+        h.update((c.get("text") or "").encode())
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def cached_search_chunks(env, q_key, k, scope, min_score, _q_vec):
+    # keyed on the query vector bytes; the list form is only sent to Neo4j
+    with get_driver(env).session() as session:
+        return vector_search_chunks(session, _q_vec, k, scope, min_score)
+
+
+def _fallback_search(driver, search, q_vec, k, min_score):
+    # runs on a worker thread, so it takes its own session from the pool
+    try:
+        with driver.session() as session:
+            return search(session, q_vec, k, min_score)
+    except Exception:
+        return []
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def cached_synthesize(env, question, ctx_key, _contexts):
+    # same question over the same retrieved context -> same answer, skip the LLM
+    return synthesize(env, question, _contexts)
+
+
 st.set_page_config(page_title="Graph RAG — Parts", layout="centered")
 st.title("GraphRAG for Product Asset Intelligence")
 
-env = load_env()
-embed = get_embedder(env)
+env = load_settings()
+get_embedder(env)  # load the model up front, not on the first "Ask"
 
 question = st.text_input("Ask a question", value="List the sensor suite composition")
 col1, col2, col3 = st.columns(3)
@@ -187,32 +174,37 @@ scope = scope_map[scope_ui]
 
 if st.button("Ask"):
     with st.spinner("Retrieving…"):
-        driver = GraphDatabase.driver(env["NEO4J_URI"], auth=(env["NEO4J_USER"], env["NEO4J_PASSWORD"]))
-        q_vec = embed(question)[0]
-        with driver.session() as session:
-            rows = vector_search_chunks(session, q_vec, k, scope)
-
-            # client-side min-score filter
-            if min_score > 0:
-                rows = [r for r in rows if float(r.get("score") or 0.0) >= min_score]
-
-            # fallbacks (trigger only if empty after filtering)
-            if not rows:
-                if fallback_parts and scope in ("all", "part"):
-                    try:
-                        rows = vector_search_parts(session, q_vec, k)
-                        if min_score > 0:
-                            rows = [r for r in rows if float(r.get("score") or 0.0) >= min_score]
-                    except Exception:
-                        rows = []
-                if not rows and fallback_products and scope in ("all", "product"):
-                    try:
-                        rows = vector_search_products(session, q_vec, k)
-                        if min_score > 0:
-                            rows = [r for r in rows if float(r.get("score") or 0.0) >= min_score]
-                    except Exception:
-                        rows = []
-        driver.close()
+        driver = get_driver(env)
+        q_arr = cached_embed(env, question)
+        q_vec = q_arr.tolist()
+
+        # fallback searches start alongside the chunk search (own sessions
+        # on the shared driver) and are only used if chunks come back empty
+        fallbacks = []
+        if fallback_parts and scope in ("all", "part"):
+            fallbacks.append(vector_search_parts)
+        if fallback_products and scope in ("all", "product"):
+            fallbacks.append(vector_search_products)
+
+        ex = ThreadPoolExecutor(max_workers=max(len(fallbacks), 1))
+        try:
+            pending = [
+                ex.submit(_fallback_search, driver, fn, q_vec, k, min_score)
+                for fn in fallbacks
+            ]
+            # min_score is applied in Cypher, next to the index lookup
+            rows = cached_search_chunks(env, q_arr.tobytes(), k, scope, min_score, q_vec)
+
+            # fallbacks, in order (used only if no chunk clears min_score)
+            for future in pending:
+                if rows:
+                    break
+                rows = future.result()
+        finally:
+            # don't wait on fallbacks whose results are no longer needed
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    add_clean_text(rows)  # once, for both the expanders and the prompt
 
     if not rows:
         st.warning("No results. Add per-part documents or enable one of the fallbacks.")
@@ -222,8 +214,7 @@ if st.button("Ask"):
             score_val = float(r.get("score") or 0.0)
             header = f"[{idx}] {r.get('category')} = {r.get('part_name')} ({r.get('part_id')}) • Score {score_val:.4f} • Doc {r.get('doc_name')} ({r.get('source')})"
             with st.expander(header, expanded=(idx == 1)):
-                snippet = (r.get("text") or "").replace("\n", " ").strip()
-                st.write(textwrap.fill(snippet, width=100))
+                st.write(textwrap.fill(r["text_clean"], width=100))
 
         st.download_button(
             "Download results as JSON",
@@ -233,7 +224,7 @@ if st.button("Ask"):
             use_container_width=True
         )
 
-        answer = synthesize(env, question, rows)
+        answer = cached_synthesize(env, question, context_key(rows), rows)
         if answer:
             st.subheader("Answer")
             st.write(answer)
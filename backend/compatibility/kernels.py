@@ -0,0 +1,101 @@
+# backend/compatibility/kernels.py
+"""
+Numeric kernels for compatibility scoring.
+
+The spec-value kernel is JIT-compiled with numba when it is installed;
+otherwise an equivalent vectorized NumPy implementation is used. The
+spec-overlap kernel only exists with numba (`spec_overlap` is None
+without it; scoring then falls back to per-key NumPy matrices). Embedding
+cosines stay on NumPy matmul, which already dispatches to BLAS.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional
+    njit = None
+
+
+def _score_numeric_numpy(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    abs_a = np.abs(a)
+    abs_b = np.abs(b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # fmax, not maximum: NaN (from inf/nan specs) scores 0 like max(0.0, nan)
+        scores = np.fmax(0.0, 1.0 - np.abs(a - b) / np.maximum(abs_a, abs_b))
+    scores = np.where((a == 0) | (b == 0), 0.0, scores)
+    return np.where((a == 0) & (b == 0), 1.0, scores)
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _closeness(x, y):
+        if x == 0.0 and y == 0.0:
+            return 1.0
+        if x == 0.0 or y == 0.0:
+            return 0.0
+        return max(0.0, 1.0 - abs(x - y) / max(abs(x), abs(y)))
+
+    @njit(cache=True)
+    def _score_numeric_kernel(a, b):
+        out = np.empty(a.shape[0], dtype=np.float64)
+        for i in range(a.shape[0]):
+            out[i] = _closeness(a[i], b[i])
+        return out
+
+    @njit(cache=True)
+    def spec_overlap(l_ptr, l_keys, l_num, l_cat, r_ptr, r_keys, r_num, r_cat):
+        """
+        Mean spec closeness for every (left, right) pair. Each side is CSR:
+        part i owns entries ptr[i]:ptr[i+1], sorted by integer key id, with
+        a numeric value (NaN if not numeric) and a categorical code (-1 if
+        numeric/None). Shared keys are found with a merge-style scan.
+        """
+        n_left = l_ptr.shape[0] - 1
+        n_right = r_ptr.shape[0] - 1
+        out = np.zeros((n_left, n_right), dtype=np.float64)
+        for a in range(n_left):
+            for b in range(n_right):
+                i, i_end = l_ptr[a], l_ptr[a + 1]
+                j, j_end = r_ptr[b], r_ptr[b + 1]
+                total = 0.0
+                count = 0
+                while i < i_end and j < j_end:
+                    if l_keys[i] < r_keys[j]:
+                        i += 1
+                    elif l_keys[i] > r_keys[j]:
+                        j += 1
+                    else:
+                        x = l_num[i]
+                        y = r_num[j]
+                        if not np.isnan(x) and not np.isnan(y):
+                            total += _closeness(x, y)
+                            count += 1
+                        elif l_cat[i] >= 0 and l_cat[i] == r_cat[j]:
+                            total += 1.0
+                            count += 1
+                        i += 1
+                        j += 1
+                if count > 0:
+                    out[a, b] = total / count
+        return out
+
+else:
+    _score_numeric_kernel = _score_numeric_numpy
+    spec_overlap = None
+
+
+def score_numeric(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Relative-difference closeness of numeric spec values, elementwise with
+    broadcasting: 1.0 when both are zero, 0.0 when only one is, else
+    max(0, 1 - |a-b| / max(|a|,|b|)).
+    """
+    a, b = np.broadcast_arrays(
+        np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    )
+    flat = _score_numeric_kernel(
+        np.ascontiguousarray(a).ravel(), np.ascontiguousarray(b).ravel()
+    )
+    return flat.reshape(a.shape)
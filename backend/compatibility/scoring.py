@@ -14,17 +14,38 @@ Compatibility scoring engine v2.0
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
-import math
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from neo4j import Session
+import numpy as np
+from neo4j import ManagedTransaction
 
-from ..db import run_read, run_write, get_session
+from ..config import get_settings
+from ..db import iter_batches, run_read, run_write, get_session
 from ..embeddings import embed_text
+from .kernels import score_numeric, spec_overlap
 from ..ingestion.yaml_ingestor import ASSEMBLY_MAP  # reuse same mapping
 
 
+# Component weights (can be tuned)
+_W_MECH = 0.35
+_W_FUNC = 0.25
+_W_SEM = 0.25
+_W_HIER = 0.15
+
+logger = logging.getLogger(__name__)
+
+# product name -> write generation; bumping it invalidates cached part fetches
+_PRODUCT_VERSIONS: Dict[str, int] = {}
+
+# Cached part fetches also expire every _PARTS_CACHE_TTL seconds: ingests run
+# in other processes (scripts/ingest.py) can't bump this process's versions.
+_PARTS_CACHE_TTL = 300
+
+
 # Internal model
 
 @dataclass
@@ -33,73 +54,115 @@ class PartInfo:
     name: str
     category: str
     description: Optional[str]
-    assemblies: List[str]
+    assemblies: Tuple[str, ...]  # tuple: PartInfo objects are shared via the part cache
     specs: Dict[str, Tuple[Any, str]]  # key -> (value, unit)
-    embedding: Optional[List[float]]
+    embedding: Optional[np.ndarray]  # float32, converted once at fetch time
+    embedding_np: Optional[np.ndarray] = field(init=False, default=None)  # unit-norm
+
+    def __post_init__(self) -> None:
+        # normalize once per part instead of once per comparison
+        if self.embedding is not None and len(self.embedding):
+            vec = np.asarray(self.embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(vec))
+            if norm > 0:
+                self.embedding_np = vec / norm
 
 
 # Fetch helpers
 
-def _fetch_parts_for_product(product_name: str) -> List[PartInfo]:
+def _as_float32(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+    if embedding is None:
+        return None
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _fetch_parts_for_product(
+    product_name: str, with_embeddings: bool = True
+) -> List[PartInfo]:
     """
-    Fetch all parts belonging to a product via assemblies, including specs & embeddings.
+    Fetch all parts belonging to a product via assemblies, including specs & embeddings,
+    in a single query. Specs and assemblies are gathered with pattern comprehensions
+    so each part comes back as exactly one row (no spec x assembly row blow-up).
     """
     rows = run_read(
         """
-        MATCH (prod:Product {name: $name})-[:HAS_ASSEMBLY]->(a:Assembly)
+        MATCH (prod:Product {name: $name})-[:HAS_ASSEMBLY]->(:Assembly)
               <-[:BELONGS_TO]-(p:Part)
-        OPTIONAL MATCH (p)-[:HAS_SPEC]->(s:Spec)
-        OPTIONAL MATCH (p)-[:BELONGS_TO]->(a2:Assembly)
-        RETURN p,
-               collect(DISTINCT s) AS specs,
-               collect(DISTINCT a2.name) AS assemblies
+        WITH DISTINCT p
+        RETURN p.part_id AS part_id,
+               p.name AS name,
+               coalesce(p.category, 'Uncategorized') AS category,
+               p.description AS description,
+               CASE WHEN $with_embeddings THEN p.embedding END AS embedding,
+               [(p)-[:HAS_SPEC]->(s:Spec) | {key: s.key, value: s.value, unit: s.unit}] AS specs,
+               [(p)-[:BELONGS_TO]->(a:Assembly) | a.name] AS assemblies
         """,
-        {"name": product_name},
+        {"name": product_name, "with_embeddings": with_embeddings},
     )
 
     parts: List[PartInfo] = []
     for row in rows:
-        p = row["p"]
-        if p is None:
-            continue
-
-        part_id = p.get("part_id")
+        part_id = row.get("part_id")
         if not part_id:
             continue
 
-        name = p.get("name")
-        category = p.get("category", "Uncategorized")
-        description = p.get("description")
-        assemblies = [a for a in (row.get("assemblies") or []) if a]
+        assemblies = tuple(a for a in (row.get("assemblies") or []) if a)
 
-        # specs: list of nodes -> dict
+        # specs: list of maps -> dict
         specs_dict: Dict[str, Tuple[Any, str]] = {}
         for s in row.get("specs") or []:
-            if not s:
-                continue
             key = s.get("key")
-            value = s.get("value")
-            unit = s.get("unit") or ""
             if key:
-                specs_dict[key] = (value, unit)
-
-        embedding = p.get("embedding")
+                specs_dict[key] = (s.get("value"), s.get("unit") or "")
 
         parts.append(
             PartInfo(
                 part_id=part_id,
-                name=name,
-                category=category,
-                description=description,
+                name=row.get("name"),
+                category=row["category"],
+                description=row.get("description"),
                 assemblies=assemblies,
                 specs=specs_dict,
-                embedding=embedding,
+                embedding=_as_float32(row.get("embedding")),
             )
         )
 
     return parts
 
 
+@lru_cache(maxsize=32)
+def _fetch_parts_cached(
+    product_name: str, version: int, time_bucket: int, with_embeddings: bool
+) -> Tuple[Tuple[PartInfo, ...], np.ndarray, np.ndarray]:
+    """
+    Cache-aside layer over _fetch_parts_for_product: returns the de-duplicated
+    parts plus their normalized embedding matrix and validity mask.
+    `version` and `time_bucket` only key the cache (see _get_product_parts).
+    """
+    fetched = _fetch_parts_for_product(product_name, with_embeddings)
+    parts = tuple({p.part_id: p for p in fetched}.values())
+    emb_matrix, has_emb = _embedding_matrix(list(parts))
+    emb_matrix.flags.writeable = False
+    has_emb.flags.writeable = False
+    return parts, emb_matrix, has_emb
+
+
+def _get_product_parts(
+    product_name: str, with_embeddings: bool = True
+) -> Tuple[Tuple[PartInfo, ...], np.ndarray, np.ndarray]:
+    version = _PRODUCT_VERSIONS.get(product_name, 0)
+    time_bucket = int(time.monotonic() // _PARTS_CACHE_TTL)
+    return _fetch_parts_cached(product_name, version, time_bucket, with_embeddings)
+
+
+def invalidate_product_cache(product_name: str) -> None:
+    """
+    Drop cached parts for a product; call after writes that touch its parts.
+    Only affects this process; others pick the change up within _PARTS_CACHE_TTL.
+    """
+    _PRODUCT_VERSIONS[product_name] = _PRODUCT_VERSIONS.get(product_name, 0) + 1
+
+
 # Scoring helpers
 
 def _is_number(value: Any) -> bool:
@@ -110,15 +173,6 @@ def _is_number(value: Any) -> bool:
         return False
 
 
-def _score_numeric(a: float, b: float) -> float:
-    if a == 0 and b == 0:
-        return 1.0
-    if a == 0 or b == 0:
-        return 0.0
-    rel_diff = abs(a - b) / max(abs(a), abs(b))
-    return max(0.0, 1.0 - rel_diff)
-
-
 def _mechanical_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]]:
     """
     Compare overlapping numeric + categorical specs.
@@ -127,18 +181,20 @@ def _mechanical_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]
     explanations: List[str] = []
     scores: List[float] = []
 
-    # numeric specs
+    # numeric specs are scored together in one kernel call
+    numeric_keys: List[str] = []
+    values_1: List[float] = []
+    values_2: List[float] = []
+
     shared_keys = set(p1.specs.keys()) & set(p2.specs.keys())
     for key in shared_keys:
         v1, u1 = p1.specs[key]
         v2, u2 = p2.specs[key]
 
         if _is_number(v1) and _is_number(v2):
-            s = _score_numeric(float(v1), float(v2))
-            scores.append(s)
-            explanations.append(
-                f"Numeric spec '{key}' close: {v1}{u1} vs {v2}{u2} (score={s:.2f})"
-            )
+            numeric_keys.append(key)
+            values_1.append(float(v1))
+            values_2.append(float(v2))
         else:
             if v1 == v2 and v1 is not None:
                 s = 1.0
@@ -147,6 +203,16 @@ def _mechanical_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]
                     f"Categorical spec '{key}' matches: {v1} (score={s:.2f})"
                 )
 
+    if numeric_keys:
+        numeric_scores = score_numeric(np.array(values_1), np.array(values_2))
+        for key, s in zip(numeric_keys, numeric_scores.tolist()):
+            v1, u1 = p1.specs[key]
+            v2, u2 = p2.specs[key]
+            scores.append(s)
+            explanations.append(
+                f"Numeric spec '{key}' close: {v1}{u1} vs {v2}{u2} (score={s:.2f})"
+            )
+
     if not scores:
         return 0.0, ["No shared specs; mechanical similarity default 0.0"]
 
@@ -154,81 +220,83 @@ def _mechanical_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]
     return avg_score, explanations
 
 
-def _functional_role_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]]:
-    """
-    Score based on category + known pairs.
-    """
-    explanations: List[str] = []
+# Known cross-category functional pairings (score 0.8)
+_FUNCTIONAL_PAIRINGS = {
+    ("Bearings", "Spindle"),
+    ("Spindle", "Bearings"),
 
-    # direct category equality
-    if p1.category == p2.category:
-        explanations.append(
-            f"Same category '{p1.category}' for both parts (score=1.0)"
-        )
-        return 1.0, explanations
+    ("Z Axis", "Z Axis"),
+    ("X Axis", "X Axis"),
 
-    score = 0.0
+    ("Tailstock", "Tailstock"),
 
-    pairings = {
-        ("Bearings", "Spindle"),
-        ("Spindle", "Bearings"),
+    ("Mold", "Mold"),
+    ("Materials", "Mold"),
+    ("Tools", "Mold"),
 
-        ("Z Axis", "Z Axis"),
-        ("X Axis", "X Axis"),
+    ("Workholding", "Spindle"),  # Chuck ⇄ Spindle
+    ("Spindle", "Workholding"),
 
-        ("Tailstock", "Tailstock"),
+    ("Motor", "Spindle"),  # DC spindle motor / drive
+    ("Spindle", "Motor"),
 
-        ("Mold", "Mold"),
-        ("Materials", "Mold"),
-        ("Tools", "Mold"),
+    ("Transmission", "Spindle"),  # Belt drive ⇄ spindle rotation
+    ("Spindle", "Transmission"),
 
-        ("Workholding", "Spindle"),  # Chuck ⇄ Spindle
-        ("Spindle", "Workholding"),
+    ("Mechanical", "Spindle"),  # Shafts used in spindle system
+    ("Spindle", "Mechanical"),
 
-        ("Motor", "Spindle"),  # DC spindle motor / drive
-        ("Spindle", "Motor"),
+    ("Bearings", "Mechanical"),  # supporting rotating shafts
+    ("Mechanical", "Bearings"),
 
-        ("Transmission", "Spindle"),  # Belt drive ⇄ spindle rotation
-        ("Spindle", "Transmission"),
+    ("Linear Motion", "Frame"),  # linear rails mounted on 2020 extrusion
+    ("Frame", "Linear Motion"),
 
-        ("Mechanical", "Spindle"),  # Shafts used in spindle system
-        ("Spindle", "Mechanical"),
+    ("Linear Motion", "Motor"),  # NEMA17 stepper drives linear axes
+    ("Motor", "Linear Motion"),
 
-        ("Bearings", "Mechanical"),  # supporting rotating shafts
-        ("Mechanical", "Bearings"),
+    ("Linear Motion", "Hardware"),  # screws, inserts used in motion assembly
+    ("Hardware", "Linear Motion"),
 
-        ("Linear Motion", "Frame"),  # linear rails mounted on 2020 extrusion
-        ("Frame", "Linear Motion"),
+    ("Frame", "Hardware"),  # bolts + inserts mounting onto extrusion
+    ("Hardware", "Frame"),
 
-        ("Linear Motion", "Motor"),  # NEMA17 stepper drives linear axes
-        ("Motor", "Linear Motion"),
+    ("Electronics", "Motor"),  # PWM → DC motor, driver → NEMA17
+    ("Motor", "Electronics"),
 
-        ("Linear Motion", "Hardware"),  # screws, inserts used in motion assembly
-        ("Hardware", "Linear Motion"),
+    ("Electronics", "Linear Motion"),  # Arduino + driver controlling stepper axis
+    ("Linear Motion", "Electronics"),
 
-        ("Frame", "Hardware"),  # bolts + inserts mounting onto extrusion
-        ("Hardware", "Frame"),
+    ("Electronics", "Tools"),  # Display, control UI, etc.
+    ("Tools", "Electronics"),
 
-        ("Electronics", "Motor"),  # PWM → DC motor, driver → NEMA17
-        ("Motor", "Electronics"),
+    ("Rotary Tool", "Tools"),  # Dremel + carbide burrs
+    ("Tools", "Rotary Tool"),
 
-        ("Electronics", "Linear Motion"),  # Arduino + driver controlling stepper axis
-        ("Linear Motion", "Electronics"),
+    ("Rotary Tool", "Workholding"),  # rotary engraving/cutting often mounted
+    ("Workholding", "Rotary Tool"),
 
-        ("Electronics", "Tools"),  # Display, control UI, etc.
-        ("Tools", "Electronics"),
+    ("Hardware", "Materials"),
+    ("Materials", "Hardware"),
+}
 
-        ("Rotary Tool", "Tools"),  # Dremel + carbide burrs
-        ("Tools", "Rotary Tool"),
 
-        ("Rotary Tool", "Workholding"),  # rotary engraving/cutting often mounted
-        ("Workholding", "Rotary Tool"),
+def _functional_role_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]]:
+    """
+    Score based on category + known pairs.
+    """
+    explanations: List[str] = []
 
-        ("Hardware", "Materials"),
-        ("Materials", "Hardware"),
-    }
+    # direct category equality
+    if p1.category == p2.category:
+        explanations.append(
+            f"Same category '{p1.category}' for both parts (score=1.0)"
+        )
+        return 1.0, explanations
+
+    score = 0.0
 
-    if (p1.category, p2.category) in pairings:
+    if (p1.category, p2.category) in _FUNCTIONAL_PAIRINGS:
         score = 0.8
         explanations.append(
             f"Functional pairing between '{p1.category}' and '{p2.category}' (score=0.8)"
@@ -241,26 +309,76 @@ def _functional_role_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List
     return score, explanations
 
 
-def _semantic_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]]:
+def _embedding_matrix(parts: List[PartInfo]) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Cosine similarity on stored embeddings, mapped from [-1,1] to [0,1].
+    Stack the parts' pre-normalized embeddings into an (N, D) float32 matrix.
+    Returns (matrix, valid) where `valid` marks rows with a usable embedding;
+    invalid rows are left as zeros.
     """
-    e1 = p1.embedding
-    e2 = p2.embedding
-    if not e1 or not e2:
-        return 0.5, ["Missing embeddings; semantic similarity default 0.5"]
+    dim = next((len(p.embedding_np) for p in parts if p.embedding_np is not None), 0)
+    matrix = np.zeros((len(parts), dim), dtype=np.float32)
+    valid = np.zeros(len(parts), dtype=bool)
+    for i, p in enumerate(parts):
+        if p.embedding_np is not None and len(p.embedding_np) == dim:
+            matrix[i] = p.embedding_np
+            valid[i] = True
+    return matrix, valid
+
 
-    dot = sum(float(x) * float(y) for x, y in zip(e1, e2))
-    norm1 = math.sqrt(sum(float(x) * float(x) for x in e1))
-    norm2 = math.sqrt(sum(float(y) * float(y) for y in e2))
-    if norm1 == 0 or norm2 == 0:
-        return 0.5, ["Zero-length embeddings; semantic similarity default 0.5"]
+def _semantic_similarity(cos: Optional[float]) -> Tuple[float, List[str]]:
+    """
+    Map a precomputed embedding cosine from [-1,1] to [0,1].
+    `cos` is None when either part lacks a usable embedding.
+    """
+    if cos is None:
+        return 0.5, ["Missing embeddings; semantic similarity default 0.5"]
 
-    cos = dot / (norm1 * norm2)
-    score = (cos + 1.0) / 2.0  # map [-1,1] → [0,1]
+    score = (float(cos) + 1.0) / 2.0  # map [-1,1] → [0,1]
     return score, [f"Embedding cosine similarity ~ {score:.2f}"]
 
 
+def _server_cosine_matrix(parts: List[PartInfo]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairwise embedding cosines computed inside Neo4j with the native
+    vector.similarity.cosine() function (5.18+), so embeddings never leave
+    the database. Returns (cos, valid) as (N, N) matrices.
+    """
+    n = len(parts)
+    cos = np.zeros((n, n), dtype=np.float32)
+    valid = np.zeros((n, n), dtype=bool)
+
+    # each part is looked up once; the i<j pair expansion and the cosine
+    # both run server-side over the collected embeddings
+    rows = run_read(
+        """
+        UNWIND range(0, size($ids) - 1) AS i
+        MATCH (p:Part {part_id: $ids[i]})
+        WHERE p.embedding IS NOT NULL
+        WITH collect({i: i, e: p.embedding}) AS ps
+        UNWIND range(0, size(ps) - 2) AS x
+        UNWIND range(x + 1, size(ps) - 1) AS y
+        RETURN ps[x].i AS i, ps[y].i AS j,
+               vector.similarity.cosine(ps[x].e, ps[y].e) AS sim
+        """,
+        {"ids": [p.part_id for p in parts]},
+    )
+    if rows:
+        i = np.fromiter((row["i"] for row in rows), dtype=np.int64, count=len(rows))
+        j = np.fromiter((row["j"] for row in rows), dtype=np.int64, count=len(rows))
+        sim = np.fromiter((row["sim"] for row in rows), dtype=np.float32, count=len(rows))
+        # the function returns (1 + cos) / 2; map back to a raw cosine
+        cos[i, j] = cos[j, i] = 2.0 * sim - 1.0
+        valid[i, j] = valid[j, i] = True
+    return cos, valid
+
+
+def _cosine_matrix(
+    emb_matrix: np.ndarray, has_emb: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """All pairwise cosines in one matmul. Returns (cos, valid) as (N, N) matrices."""
+    return emb_matrix @ emb_matrix.T, has_emb[:, None] & has_emb[None, :]
+
+
 def _hierarchy_similarity(p1: PartInfo, p2: PartInfo) -> Tuple[float, List[str]]:
     """
     Simple hierarchy-based similarity:
@@ -286,17 +404,11 @@ def _combine_scores(
     """
     Combine the four components into a single score.
     """
-    # weights can be tuned
-    w_mech = 0.35
-    w_func = 0.25
-    w_sem = 0.25
-    w_hier = 0.15
-
     score = (
-        w_mech * mech
-        + w_func * func
-        + w_sem * sem
-        + w_hier * hier
+        _W_MECH * mech
+        + _W_FUNC * func
+        + _W_SEM * sem
+        + _W_HIER * hier
     )
     return score, [
         f"Final score = {score:.2f} (mechanical={mech:.2f}, functional={func:.2f}, "
@@ -304,66 +416,273 @@ def _combine_scores(
     ]
 
 
+# Vectorized scoring: all (left x right) pairs at once on column arrays
+
+def _spec_columns(
+    parts: Sequence[PartInfo], key: str, codes: Dict[Any, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One spec key as two columns: numeric values (NaN if missing/non-numeric)
+    and categorical codes (-1 if missing, None or numeric).
+    """
+    numeric = np.full(len(parts), np.nan)
+    categorical = np.full(len(parts), -1, dtype=np.int64)
+    for i, p in enumerate(parts):
+        if key not in p.specs:
+            continue
+        value = p.specs[key][0]
+        if _is_number(value):
+            numeric[i] = float(value)
+        elif value is not None:
+            try:
+                categorical[i] = codes.setdefault(value, len(codes))
+            except TypeError:  # unhashable (e.g. list) values
+                categorical[i] = codes.setdefault(repr(value), len(codes))
+    return numeric, categorical
+
+
+def _spec_csr(
+    parts: Sequence[PartInfo], key_ids: Dict[str, int], codes: Dict[Any, int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    All parts' specs as CSR arrays for the numba spec_overlap kernel:
+    (ptr, key ids sorted per part, numeric values, categorical codes).
+    """
+    ptr = [0]
+    keys: List[int] = []
+    numeric: List[float] = []
+    categorical: List[int] = []
+    for p in parts:
+        for key_id, value in sorted(
+            (key_ids.setdefault(key, len(key_ids)), spec[0]) for key, spec in p.specs.items()
+        ):
+            keys.append(key_id)
+            if _is_number(value):
+                numeric.append(float(value))
+                categorical.append(-1)
+            else:
+                numeric.append(np.nan)
+                if value is None:
+                    categorical.append(-1)
+                else:
+                    try:
+                        categorical.append(codes.setdefault(value, len(codes)))
+                    except TypeError:  # unhashable (e.g. list) values
+                        categorical.append(codes.setdefault(repr(value), len(codes)))
+        ptr.append(len(keys))
+    return (
+        np.asarray(ptr, dtype=np.int64),
+        np.asarray(keys, dtype=np.int64),
+        np.asarray(numeric, dtype=np.float64),
+        np.asarray(categorical, dtype=np.int64),
+    )
+
+
+def _mechanical_matrix(left: Sequence[PartInfo], right: Sequence[PartInfo]) -> np.ndarray:
+    """Mean spec closeness over shared keys (same rules as _mechanical_similarity)."""
+    if spec_overlap is not None:
+        key_ids: Dict[str, int] = {}
+        codes: Dict[Any, int] = {}
+        return spec_overlap(*_spec_csr(left, key_ids, codes), *_spec_csr(right, key_ids, codes))
+
+    keys = set().union(*(p.specs for p in left)) & set().union(*(p.specs for p in right))
+    total = np.zeros((len(left), len(right)))
+    count = np.zeros((len(left), len(right)))
+
+    for key in keys:
+        codes: Dict[Any, int] = {}
+        num_l, cat_l = _spec_columns(left, key, codes)
+        num_r, cat_r = _spec_columns(right, key, codes)
+
+        both_numeric = ~np.isnan(num_l)[:, None] & ~np.isnan(num_r)[None, :]
+        if both_numeric.any():
+            closeness = score_numeric(
+                np.nan_to_num(num_l)[:, None], np.nan_to_num(num_r)[None, :]
+            )
+            total += np.where(both_numeric, closeness, 0.0)
+            count += both_numeric
+
+        same_value = (cat_l[:, None] == cat_r[None, :]) & (cat_l[:, None] >= 0)
+        total += same_value
+        count += same_value
+
+    return np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+
+def _functional_matrix(left: Sequence[PartInfo], right: Sequence[PartInfo]) -> np.ndarray:
+    """Categories as small-int ids; scoring is one gather from a (C, C) table."""
+    cat_to_id = {c: i for i, c in enumerate(dict.fromkeys(p.category for p in (*left, *right)))}
+
+    func_lut = np.zeros((len(cat_to_id), len(cat_to_id)), dtype=np.float32)
+    for a, b in _FUNCTIONAL_PAIRINGS:
+        if a in cat_to_id and b in cat_to_id:
+            func_lut[cat_to_id[a], cat_to_id[b]] = 0.8
+    np.fill_diagonal(func_lut, 1.0)
+
+    ids_l = np.array([cat_to_id[p.category] for p in left], dtype=np.intp)
+    ids_r = np.array([cat_to_id[p.category] for p in right], dtype=np.intp)
+    return func_lut[ids_l[:, None], ids_r[None, :]].astype(np.float64)
+
+
+def _hierarchy_matrix(left: Sequence[PartInfo], right: Sequence[PartInfo]) -> np.ndarray:
+    index: Dict[str, int] = {}
+    for p in (*left, *right):
+        for a in p.assemblies:
+            index.setdefault(a, len(index))
+
+    def membership(parts: Sequence[PartInfo]) -> np.ndarray:
+        m = np.zeros((len(parts), len(index)), dtype=np.float32)
+        for i, p in enumerate(parts):
+            m[i, [index[a] for a in p.assemblies]] = 1.0
+        return m
+
+    return ((membership(left) @ membership(right).T) > 0).astype(np.float64)
+
+
+def _score_matrices(
+    left: Sequence[PartInfo],
+    right: Sequence[PartInfo],
+    cos: np.ndarray,
+    cos_valid: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Fused scoring pass: every component plus the weighted total as
+    (len(left), len(right)) matrices.
+    """
+    mech = _mechanical_matrix(left, right)
+    func = _functional_matrix(left, right)
+    sem = np.where(cos_valid, (cos + 1.0) / 2.0, 0.5)
+    hier = _hierarchy_matrix(left, right)
+    return {
+        "mechanical": mech,
+        "functional": func,
+        "semantic": sem,
+        "hierarchy": hier,
+        "score": _W_MECH * mech + _W_FUNC * func + _W_SEM * sem + _W_HIER * hier,
+    }
+
+
+def _explain_pair(p1: PartInfo, p2: PartInfo, cos: Optional[float]) -> List[str]:
+    """Human-readable reasons for one pair, from the per-pair rule helpers."""
+    mech, mech_exp = _mechanical_similarity(p1, p2)
+    func, func_exp = _functional_role_similarity(p1, p2)
+    sem, sem_exp = _semantic_similarity(cos)
+    hier, hier_exp = _hierarchy_similarity(p1, p2)
+    _, final_exp = _combine_scores(mech, func, sem, hier)
+    return mech_exp + func_exp + sem_exp + hier_exp + final_exp
+
+
+def explanations_cypher(rel: str) -> str:
+    """
+    Cypher expression for the reasons on COMPATIBLE_WITH edge `rel`: the
+    stored `explanations` (written with explain=True), otherwise a one-line
+    summary rebuilt from the numeric score components.
+    """
+    return f"""coalesce({rel}.explanations, [
+        'Final score = ' + toString(round({rel}.score, 2))
+        + ' (mechanical=' + toString(round({rel}.mechanical, 2))
+        + ', functional=' + toString(round({rel}.functional, 2))
+        + ', semantic=' + toString(round({rel}.semantic, 2))
+        + ', hierarchy=' + toString(round({rel}.hierarchy, 2)) + ')'
+    ])"""
+
+
 # Public API 1: Compatibility among existing parts in a Product
 
-def compute_compatibility_for_product(product_name: str) -> None:
+def compute_compatibility_for_product(product_name: str, explain: bool = False) -> None:
     """
     Compute COMPATIBLE_WITH relationships for all parts of a product.
     Writes to Neo4j: (a)-[:COMPATIBLE_WITH {score, ...}]->(b)
+
+    Only the numeric components are stored unless `explain` is set; readers
+    derive a summary from them when `explanations` is absent.
     """
-    parts = _fetch_parts_for_product(product_name)
-    part_map = {p.part_id: p for p in parts}
-    ids = list(part_map.keys())
-
-    def work(session: Session):
-        for i, a_id in enumerate(ids):
-            p1 = part_map[a_id]
-            for b_id in ids[i + 1 :]:
-                p2 = part_map[b_id]
-
-                mech, mech_exp = _mechanical_similarity(p1, p2)
-                func, func_exp = _functional_role_similarity(p1, p2)
-                sem, sem_exp = _semantic_similarity(p1, p2)
-                hier, hier_exp = _hierarchy_similarity(p1, p2)
-                final, final_exp = _combine_scores(mech, func, sem, hier)
-
-                explanations = mech_exp + func_exp + sem_exp + hier_exp + final_exp
-
-                session.run(
-                    """
-                    MATCH (a:Part {part_id: $a_id}), (b:Part {part_id: $b_id})
-                    MERGE (a)-[r:COMPATIBLE_WITH]->(b)
-                    SET r.score = $score,
-                        r.mechanical = $mech,
-                        r.functional = $func,
-                        r.semantic = $sem,
-                        r.hierarchy = $hier,
-                        r.explanations = $explanations
-                    MERGE (b)-[r2:COMPATIBLE_WITH]->(a)
-                    SET r2.score = r.score,
-                        r2.mechanical = r.mechanical,
-                        r2.functional = r.functional,
-                        r2.semantic = r.semantic,
-                        r2.hierarchy = r.hierarchy,
-                        r2.explanations = r.explanations
-                    """,
-                    a_id=a_id,
-                    b_id=b_id,
-                    score=final,
-                    mech=mech,
-                    func=func,
-                    sem=sem,
-                    hier=hier,
-                    explanations=explanations,
-                )
+    server_side = get_settings().COMPAT_SEMANTIC_BACKEND == "neo4j"
+    parts, emb_matrix, has_emb = _get_product_parts(
+        product_name, with_embeddings=not server_side
+    )
 
-                print(
-                    f"{product_name}: {a_id} ↔ {b_id} score={final:.2f} "
-                    f"(mech={mech:.2f}, func={func:.2f}, sem={sem:.2f}, hier={hier:.2f})"
-                )
+    if server_side:
+        cos_matrix, cos_valid = _server_cosine_matrix(list(parts))
+    else:
+        cos_matrix, cos_valid = _cosine_matrix(emb_matrix, has_emb)
+
+    comps = _score_matrices(parts, parts, cos_matrix, cos_valid)
+
+    # gather every upper-triangle pair from the score matrices at once
+    # (fancy indexing + tolist) instead of five numpy scalar reads per pair
+    iu, ju = np.triu_indices(len(parts), k=1)
+    columns = zip(
+        iu.tolist(),
+        ju.tolist(),
+        comps["score"][iu, ju].tolist(),
+        comps["mechanical"][iu, ju].tolist(),
+        comps["functional"][iu, ju].tolist(),
+        comps["semantic"][iu, ju].tolist(),
+        comps["hierarchy"][iu, ju].tolist(),
+    )
+
+    rows: List[Dict[str, Any]] = []
+    for i, j, final, mech, func, sem, hier in columns:
+        p1, p2 = parts[i], parts[j]
+        rows.append(
+            {
+                "a_id": p1.part_id,
+                "b_id": p2.part_id,
+                "score": final,
+                "mech": mech,
+                "func": func,
+                "sem": sem,
+                "hier": hier,
+                "explanations": (
+                    _explain_pair(p1, p2, cos_matrix[i, j] if cos_valid[i, j] else None)
+                    if explain
+                    else None
+                ),
+            }
+        )
+
+        logger.debug(
+            "%s: %s ↔ %s score=%.2f (mech=%.2f, func=%.2f, sem=%.2f, hier=%.2f)",
+            product_name, p1.part_id, p2.part_id, final, mech, func, sem, hier,
+        )
+
+    def work(tx: ManagedTransaction):
+        # one UNWIND per batch instead of one round-trip per pair
+        for batch in iter_batches(rows):
+            tx.run(
+                """
+                UNWIND $rows AS row
+                MATCH (a:Part {part_id: row.a_id}), (b:Part {part_id: row.b_id})
+                MERGE (a)-[r:COMPATIBLE_WITH]->(b)
+                SET r.score = row.score,
+                    r.mechanical = row.mech,
+                    r.functional = row.func,
+                    r.semantic = row.sem,
+                    r.hierarchy = row.hier,
+                    r.explanations = row.explanations
+                MERGE (b)-[r2:COMPATIBLE_WITH]->(a)
+                SET r2.score = r.score,
+                    r2.mechanical = r.mechanical,
+                    r2.functional = r.functional,
+                    r2.semantic = r.semantic,
+                    r2.hierarchy = r.hierarchy,
+                    r2.explanations = r.explanations
+                """,
+                rows=batch,
+            )
 
     run_write(work)
-    print(f"✅ Computed COMPATIBLE_WITH for product {product_name}")
+
+    # retrieval contexts embed COMPATIBLE_WITH edges; drop the stale ones
+    from ..rag.semantic_cache import clear_semantic_cache
+    clear_semantic_cache()
+
+    summary = f"{len(rows)} pairs"
+    if rows:
+        best = max(rows, key=lambda r: r["score"])
+        summary += f", best {best['a_id']} ↔ {best['b_id']} score={best['score']:.2f}"
+    print(f"✅ Computed COMPATIBLE_WITH for product {product_name} ({summary})")
 
 
 # Public API 2: Compatibility for a NEW part (not in Neo4j yet)
@@ -395,7 +714,7 @@ def _build_virtual_part(
         name="New Part",
         category=category or "Unknown",
         description=description,
-        assemblies=assemblies,
+        assemblies=tuple(assemblies),
         specs=specs or {},
         embedding=emb,
     )
@@ -408,10 +727,12 @@ def compute_compatibility_for_new_part(
     specs: Optional[Dict[str, Tuple[Any, str]]] = None,
     assembly_hint: Optional[str] = None,
     top_k: int = 10,
+    explain: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Compute compatibility of a NEW part (not stored in DB) against all parts
     of a product. Returns a sorted list of results (no writes to Neo4j).
+    Explanations are built only for the returned top_k, and only if `explain`.
 
     Example specs format:
         {
@@ -420,35 +741,44 @@ def compute_compatibility_for_new_part(
           "length": (650, "mm")
         }
     """
-    existing_parts = _fetch_parts_for_product(product_name)
+    existing_parts, emb_matrix, has_emb = _get_product_parts(product_name)
     new_part = _build_virtual_part(description, category, specs, assembly_hint)
 
-    results: List[Dict[str, Any]] = []
+    # query is normalized once in PartInfo; score it against every part in one gemv
+    query = new_part.embedding_np
+    if query is not None and len(query) == emb_matrix.shape[1]:
+        cos_vector = emb_matrix @ query
+    else:
+        cos_vector = np.zeros(len(existing_parts), dtype=np.float32)
+        has_emb = np.zeros(len(existing_parts), dtype=bool)
 
-    for p in existing_parts:
-        mech, mech_exp = _mechanical_similarity(new_part, p)
-        func, func_exp = _functional_role_similarity(new_part, p)
-        sem, sem_exp = _semantic_similarity(new_part, p)
-        hier, hier_exp = _hierarchy_similarity(new_part, p)
-        final, final_exp = _combine_scores(mech, func, sem, hier)
+    comps = _score_matrices(
+        [new_part], existing_parts, cos_vector[None, :], has_emb[None, :]
+    )
 
-        explanations = mech_exp + func_exp + sem_exp + hier_exp + final_exp
+    # rank on the score matrix; only the top_k rows are materialized
+    top = np.argsort(-comps["score"][0], kind="stable")[:top_k]
 
+    results: List[Dict[str, Any]] = []
+    for i in top.tolist():
+        p = existing_parts[i]
         results.append(
             {
                 "existing_part_id": p.part_id,
                 "existing_part_name": p.name,
                 "existing_part_category": p.category,
-                "assemblies": p.assemblies,
-                "score": final,
-                "mechanical": mech,
-                "functional": func,
-                "semantic": sem,
-                "hierarchy": hier,
-                "explanations": explanations,
+                "assemblies": list(p.assemblies),  # fresh list, not the cached part's
+                "score": float(comps["score"][0, i]),
+                "mechanical": float(comps["mechanical"][0, i]),
+                "functional": float(comps["functional"][0, i]),
+                "semantic": float(comps["semantic"][0, i]),
+                "hierarchy": float(comps["hierarchy"][0, i]),
+                "explanations": (
+                    _explain_pair(new_part, p, cos_vector[i] if has_emb[i] else None)
+                    if explain
+                    else []
+                ),
             }
         )
 
-    # sort descending by score, take top_k
-    results.sort(key=lambda r: r["score"], reverse=True)
-    return results[:top_k]
+    return results
@@ -1,29 +1,72 @@
 # backend/config.py
 import os
+from dataclasses import dataclass
 from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+@dataclass(frozen=True, slots=True)
 class Settings:
-    def __init__(self) -> None:
-        # Neo4j
-        self.NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-        self.NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-        self.NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "neo4j")
-
-        # Embeddings
-        self.EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "thenlper/gte-small")
-        self.EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
-
-        # Groq LLM (for answer synthesis)
-        self.GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
-        self.GROQ_CHAT_MODEL = os.getenv(
-            "GROQ_CHAT_MODEL", "llama-3.1-70b-versatile"
+    # Neo4j
+    NEO4J_URI: str
+    NEO4J_USER: str
+    NEO4J_PASSWORD: str
+
+    # Embeddings ("sentence-transformers" or "onnx")
+    EMBEDDING_BACKEND: str
+    EMBEDDING_ONNX_PATH: str
+    EMBEDDING_MODEL: str
+    EMBEDDING_DIM: int
+    EMBEDDING_BATCH_SIZE: int
+    EMBEDDING_NUM_THREADS: int  # CPU threads for the encoder; 0 = library default
+    EMBEDDING_CACHE_PATH: str  # SQLite embedding cache (unbounded); opt-in, empty disables it
+    # "list" (Cypher LIST<FLOAT>, 64-bit) or "float32" (typed vector property,
+    # half the store size; needs Neo4j >= 5.13)
+    EMBEDDING_STORAGE: str
+
+    # Compatibility scoring: "numpy" (in-process matmul) or "neo4j"
+    # (server-side vector.similarity.cosine, embeddings stay in the DB)
+    COMPAT_SEMANTIC_BACKEND: str
+
+    # Semantic cache in front of retrieve_context; opt-in (TTL 0, the
+    # default, disables it). SEMANTIC_CACHE_PATH shares entries and clears
+    # across processes via SQLite; without it only the TTL bounds staleness
+    # after an ingest run in another process.
+    SEMANTIC_CACHE_THRESHOLD: float
+    SEMANTIC_CACHE_TTL: float
+    SEMANTIC_CACHE_SIZE: int
+    SEMANTIC_CACHE_PATH: str
+
+    # Groq LLM (for answer synthesis)
+    GROQ_API_KEY: str
+    GROQ_CHAT_MODEL: str
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            NEO4J_URI=os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            NEO4J_USER=os.getenv("NEO4J_USER", "neo4j"),
+            NEO4J_PASSWORD=os.getenv("NEO4J_PASSWORD", "neo4j"),
+            EMBEDDING_BACKEND=os.getenv("EMBEDDING_BACKEND", "sentence-transformers"),
+            EMBEDDING_ONNX_PATH=os.getenv("EMBEDDING_ONNX_PATH", "models/gte-small-onnx"),
+            EMBEDDING_MODEL=os.getenv("EMBEDDING_MODEL", "thenlper/gte-small"),
+            EMBEDDING_DIM=int(os.getenv("EMBEDDING_DIM", "384")),
+            EMBEDDING_BATCH_SIZE=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+            EMBEDDING_NUM_THREADS=int(os.getenv("EMBEDDING_NUM_THREADS", "0")),
+            EMBEDDING_CACHE_PATH=os.getenv("EMBEDDING_CACHE_PATH", ""),
+            EMBEDDING_STORAGE=os.getenv("EMBEDDING_STORAGE", "list"),
+            COMPAT_SEMANTIC_BACKEND=os.getenv("COMPAT_SEMANTIC_BACKEND", "numpy"),
+            SEMANTIC_CACHE_THRESHOLD=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            SEMANTIC_CACHE_TTL=float(os.getenv("SEMANTIC_CACHE_TTL", "0")),
+            SEMANTIC_CACHE_SIZE=int(os.getenv("SEMANTIC_CACHE_SIZE", "256")),
+            SEMANTIC_CACHE_PATH=os.getenv("SEMANTIC_CACHE_PATH", ""),
+            GROQ_API_KEY=os.getenv("GROQ_API_KEY", ""),
+            GROQ_CHAT_MODEL=os.getenv("GROQ_CHAT_MODEL", "llama-3.3-70b-versatile"),
         )
 
 
-@lru_cache
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    return Settings()
+    return Settings.from_env()
@@ -1,10 +1,64 @@
 # backend/db.py
-from typing import Any, Callable, Dict, Iterable, List, Optional
-from neo4j import GraphDatabase, Driver, Session
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+from neo4j import GraphDatabase, Driver, ManagedTransaction, Session
 from .config import get_settings
 
 _driver: Optional[Driver] = None
 
+T = TypeVar("T")
+
+# Rows per UNWIND statement; keeps each statement's transaction state bounded
+WRITE_BATCH_SIZE = 1000
+
+# Lookup keys used by every MATCH/MERGE; unique constraints give them index seeks.
+_CONSTRAINTS = (
+    "CREATE CONSTRAINT part_id_unique IF NOT EXISTS "
+    "FOR (p:Part) REQUIRE p.part_id IS UNIQUE",
+    "CREATE CONSTRAINT product_name_unique IF NOT EXISTS "
+    "FOR (p:Product) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT assembly_name_unique IF NOT EXISTS "
+    "FOR (a:Assembly) REQUIRE a.name IS UNIQUE",
+    "CREATE CONSTRAINT document_id_unique IF NOT EXISTS "
+    "FOR (d:Document) REQUIRE d.id IS UNIQUE",
+    "CREATE CONSTRAINT doc_chunk_unique IF NOT EXISTS "
+    "FOR (c:DocChunk) REQUIRE (c.doc_id, c.chunk_index) IS UNIQUE",
+    # Spec MERGE key. Must be a uniqueness constraint, not a plain index:
+    # concurrent ingests MERGE shared specs and only a constraint makes that
+    # race-free. The earlier index on the same keys would block it. Skipped
+    # with a warning where the spec_identity NODE KEY from
+    # cypher/schema.cypher already enforces it.
+    "DROP INDEX spec_identity_idx IF EXISTS",
+    "CREATE CONSTRAINT spec_identity_unique IF NOT EXISTS "
+    "FOR (s:Spec) REQUIRE (s.key, s.value, s.unit) IS UNIQUE",
+)
+
+
+def _ensure_constraints(driver: Driver) -> None:
+    """Idempotently create the constraints / indexes (one-shot migration)."""
+    with driver.session() as session:
+        for statement in _CONSTRAINTS:
+            try:
+                session.run(statement).consume()
+            except Exception as e:
+                print(f"⚠ Could not apply schema statement: {e}")
+
+
+def set_embedding_cypher(var: str, value: str) -> str:
+    """
+    Cypher clause storing `value` as `var`.embedding. With
+    EMBEDDING_STORAGE=float32 the vector is written as a typed float[]
+    property instead of a LIST<FLOAT> of doubles.
+    """
+    if get_settings().EMBEDDING_STORAGE == "float32":
+        return f"CALL db.create.setNodeVectorProperty({var}, 'embedding', {value})"
+    return f"SET {var}.embedding = {value}"
+
+
+def iter_batches(rows: List[T], size: int = WRITE_BATCH_SIZE) -> Iterable[List[T]]:
+    """Yield consecutive slices of `rows` for UNWIND writes."""
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
 
 def get_driver() -> Driver:
     global _driver
@@ -13,22 +67,56 @@ def get_driver() -> Driver:
         _driver = GraphDatabase.driver(
             settings.NEO4J_URI,
             auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+            # pooled, keep-alive Bolt connections shared by all requests
+            max_connection_pool_size=50,
+            connection_acquisition_timeout=30,
+            keep_alive=True,
         )
+        _ensure_constraints(_driver)
     return _driver
 
 
+def close_driver() -> None:
+    """Close the pooled driver (app shutdown); the next get_driver() reopens it."""
+    global _driver
+    if _driver is not None:
+        _driver.close()
+        _driver = None
+
+
 def get_session() -> Session:
     return get_driver().session()
 
 
-def run_read(query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+def with_session(work: Callable[[Session], T]) -> T:
+    """Run `work` on one pooled session, for several dependent reads in a row."""
     with get_session() as session:
-        result = session.run(query, params or {})
-        return [r.data() for r in result]
+        return work(session)
+
+
+def run_read(
+    query: str,
+    params: Optional[Dict[str, Any]] = None,
+    session: Optional[Session] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run a read query in a managed (retryable) read transaction, on `session`
+    when given, otherwise on a fresh one from the pool.
+    """
+    if session is not None:
+        return session.execute_read(lambda tx: tx.run(query, params or {}).data())
+    with get_session() as session:
+        return session.execute_read(
+            lambda tx: tx.run(query, params or {}).data()
+        )
 
 
 def run_write(
-    work: Callable[[Session], Any]
+    work: Callable[[ManagedTransaction], Any]
 ) -> Any:
+    """
+    Run `work` in a managed write transaction. The driver may retry it on
+    transient errors, so `work` must be safe to re-run (MERGE, not CREATE).
+    """
     with get_session() as session:
-        return work(session)
+        return session.execute_write(work)
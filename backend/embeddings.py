@@ -1,27 +1,192 @@
 # backend/embeddings.py
-from typing import List
+import hashlib
+import os
+from typing import Any, List
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
 from .config import get_settings
+from .embeddings_cache import get_or_embed
+
+
+def onnx_model_file(model_dir: str) -> str:
+    """The ONNX file OnnxEncoder loads: int8 `model_quantized.onnx` if present."""
+    path = os.path.join(model_dir, "model_quantized.onnx")
+    if not os.path.exists(path):
+        path = os.path.join(model_dir, "model.onnx")
+    return path
+
+
+@lru_cache(maxsize=1)
+def model_identity() -> str:
+    """
+    Identifies the encoder producing vectors, for cache keys and stored
+    embedding hashes. For ONNX it includes the chosen file and a hash of
+    its bytes, so a re-export or quantized/FP32 switch never reuses vectors.
+    """
+    settings = get_settings()
+    if settings.EMBEDDING_BACKEND != "onnx":
+        return f"{settings.EMBEDDING_BACKEND}:{settings.EMBEDDING_MODEL}"
+
+    path = onnx_model_file(settings.EMBEDDING_ONNX_PATH)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"onnx:{os.path.abspath(path)}@{digest.hexdigest()[:16]}"
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime stand-in for SentenceTransformer.encode (mean pooling),
+    loaded from a directory written by scripts/export_onnx.py. Prefers the
+    int8 `model_quantized.onnx` when present.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 512, num_threads: int = 0) -> None:
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+
+        path = onnx_model_file(model_dir)
+
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        hidden = self.session.get_outputs()[0].shape[-1]
+        self.dim = hidden if isinstance(hidden, int) else get_settings().EMBEDDING_DIM
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 64,
+        normalize_embeddings: bool = True,
+        **_: Any,
+    ) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        # like SentenceTransformer.encode: batch in length order so each
+        # batch pads only to its own longest text, then restore input order
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                [texts[i] for i in order[start : start + batch_size]],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {
+                name: value.astype(np.int64)
+                for name, value in encoded.items()
+                if name in self.input_names
+            }
+            hidden = self.session.run(None, feeds)[0]  # (batch, tokens, dim)
+
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if normalize_embeddings:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            batches.append(pooled.astype(np.float32))
+
+        out = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        out[order] = np.concatenate(batches)
+        return out
 
 
 @lru_cache
-def get_model() -> SentenceTransformer:
+def get_model() -> Any:
+    """SentenceTransformer, or an OnnxEncoder when EMBEDDING_BACKEND=onnx."""
     settings = get_settings()
+    threads = settings.EMBEDDING_NUM_THREADS
+    if settings.EMBEDDING_BACKEND == "onnx":
+        return OnnxEncoder(settings.EMBEDDING_ONNX_PATH, num_threads=threads)
+
+    # Pin torch / BLAS only when asked; 0 keeps the library defaults so
+    # several workers on one host don't each claim every core. The env
+    # vars only take effect if set before torch is first imported.
+    if threads > 0:
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+        os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+        import torch
+        torch.set_num_threads(threads)
+
+    from sentence_transformers import SentenceTransformer
     model = SentenceTransformer(settings.EMBEDDING_MODEL)
     return model
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    if not texts:
+def chunk_by_tokens(
+    text: str, tokenizer: Any, max_tokens: int = 384, overlap: int = 64
+) -> List[str]:
+    """
+    Split text into windows of `max_tokens` model tokens overlapping by
+    `overlap`, so no chunk is silently truncated by the encoder. Windows
+    are cut from the original text via token offsets (no decode round-trip,
+    casing and spacing preserved).
+    """
+    offsets = np.asarray(
+        tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )["offset_mapping"],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    n = len(offsets)
+    if n == 0:
         return []
+
+    # closed-form window starts: 1 window if it fits, else ceil((n-K)/S)+1
+    step = max(max_tokens - overlap, 1)
+    count = 1 if n <= max_tokens else -(-(n - max_tokens) // step) + 1
+    starts = np.arange(count) * step
+    ends = np.minimum(starts + max_tokens, n) - 1
+    return [
+        text[a:b]
+        for a, b in zip(offsets[starts, 0].tolist(), offsets[ends, 1].tolist())
+    ]
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    settings = get_settings()
+
+    # smart batching: length-sorted batches pad less, restore order after
+    order = np.argsort([len(t) for t in texts], kind="stable")
     model = get_model()
-    embeddings = model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-    # Ensure Python lists for Neo4j
-    return [vec.astype(float).tolist() for vec in embeddings]
+    embeddings = model.encode(
+        [texts[i] for i in order],
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+
+    out = np.empty_like(embeddings, dtype=np.float32)
+    out[order] = embeddings
+    return out
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    Embed a batch of texts in one encode call, skipping texts already in
+    the embedding cache.
+    Returns an (N, D) float32 array of unit-normalized vectors; convert rows
+    with `.tolist()` only at the Neo4j write boundary.
+    """
+    settings = get_settings()
+    if not texts:
+        return np.empty((0, settings.EMBEDDING_DIM), dtype=np.float32)
+    if settings.EMBEDDING_CACHE_PATH:
+        return get_or_embed(texts, _encode)
+    return _encode(texts)
 
 
-def embed_text(text: str) -> List[float]:
+def embed_text(text: str) -> np.ndarray:
     return embed_texts([text])[0]
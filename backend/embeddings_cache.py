@@ -0,0 +1,83 @@
+# backend/embeddings_cache.py
+"""
+Content-addressed SQLite cache in front of the embedding model.
+
+Keys are sha256(model identity + text), values the raw float32 vector
+bytes, so re-ingesting unchanged parts/chunks or repeating a question is a
+local disk read instead of a model call.
+
+Opt-in via EMBEDDING_CACHE_PATH. There is no eviction: the file grows by
+one row (~1.5 KB at 384 dims) per distinct text, queries included; delete
+it to reset.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .config import get_settings
+
+_lock = threading.Lock()
+
+# stay well below SQLite's bound-parameter limit
+_SELECT_CHUNK = 500
+
+
+@lru_cache
+def _connect() -> sqlite3.Connection:
+    path = get_settings().EMBEDDING_CACHE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS embedding_cache "
+        "(key TEXT PRIMARY KEY, embedding BLOB NOT NULL)"
+    )
+    return conn
+
+
+def _cache_key(prefix: str, text: str) -> str:
+    return hashlib.sha256((prefix + text).encode("utf-8")).hexdigest()
+
+
+def get_or_embed(texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+    """
+    Return embeddings for `texts`, calling `encode` only for texts not yet
+    in the cache (each distinct text at most once) and storing the results.
+    """
+    from .embeddings import model_identity  # embeddings imports this module
+
+    prefix = f"{model_identity()}\0"
+    keys = [_cache_key(prefix, t) for t in texts]
+    conn = _connect()
+
+    found: Dict[str, np.ndarray] = {}
+    unique_keys = list(dict.fromkeys(keys))
+    with _lock:
+        for start in range(0, len(unique_keys), _SELECT_CHUNK):
+            batch = unique_keys[start : start + _SELECT_CHUNK]
+            rows = conn.execute(
+                "SELECT key, embedding FROM embedding_cache "
+                f"WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+    misses = {key: text for key, text in zip(keys, texts) if key not in found}
+    if misses:
+        vectors = np.asarray(encode(list(misses.values())), dtype=np.float32)
+        for key, vec in zip(misses, vectors):
+            found[key] = vec
+        with _lock, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, embedding) VALUES (?, ?)",
+                [(key, vec.tobytes()) for key, vec in zip(misses, vectors)],
+            )
+
+    return np.stack([found[key] for key in keys])
@@ -1,37 +1,200 @@
 # backend/ingestion/docs_ingestor.py
 import os
-from typing import List, Tuple
-from neo4j import Session
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from neo4j import ManagedTransaction, Session
 from pypdf import PdfReader
 
-from ..db import run_write
-from ..embeddings import embed_texts
+# PDFium (C) text extraction when installed; pypdf stays as the fallback
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
 
+from ..db import iter_batches, set_embedding_cypher, with_session
+from ..embeddings import chunk_by_tokens, embed_texts, get_model
+
+# Concurrent document write transactions (each borrows a pooled connection)
+_WRITE_WORKERS = 8
+
+# Documents committed together in one write transaction
+_DOCS_PER_TX = 50
+
+# Pages per text-extraction task; long PDFs are spread over several workers
+_PAGES_PER_TASK = 16
+
+
+_CYPHER_UPSERT_DOCUMENT = """
+MATCH (p:Part {part_id: $part_id})
+MERGE (d:Document {id: $doc_id})
+SET d.file_name = $file_name
+MERGE (p)-[:HAS_DOCUMENT]->(d)
+"""
+
+_CYPHER_UPSERT_CHUNKS = f"""
+MATCH (d:Document {{id: $doc_id}})
+UNWIND $rows AS row
+MERGE (c:DocChunk {{doc_id: $doc_id, chunk_index: row.idx}})
+SET c.text = row.text
+{set_embedding_cypher("c", "row.embedding")}
+MERGE (d)-[:HAS_CHUNK]->(c)
+"""
+
+
+@dataclass
+class PendingChunk:
+    """A document chunk waiting for its embedding."""
+    part_id: str
+    file_name: str
+    index: int
+    text: str
+    embedding: Optional[np.ndarray] = None
+
+
+def _page_count(path: str) -> int:
+    try:
+        if pdfium is not None:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+        return len(PdfReader(path).pages)
+    except Exception:
+        return 1  # one task; the worker reports the read error
+
+
+def _read_pdf(path: str, start: int = 0, stop: Optional[int] = None) -> str:
+    """Text of pages [start, stop) of the PDF at `path`."""
+    if pdfium is not None:
+        try:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                end = len(pdf) if stop is None else min(stop, len(pdf))
+                return "\n".join(
+                    pdf[i].get_textpage().get_text_range() for i in range(start, end)
+                )
+            finally:
+                pdf.close()
+        except Exception:
+            pass  # encrypted / exotic files: retry with pypdf
 
-def _read_pdf(path: str) -> str:
     reader = PdfReader(path)
     texts = []
-    for page in reader.pages:
+    for page in reader.pages[start:stop]:
         texts.append(page.extract_text() or "")
     return "\n".join(texts)
 
 
-def _chunk_text(text: str, max_tokens: int = 512) -> List[str]:
-    # naive char-based chunking; good enough for demo
-    chunks = []
-    current = []
-    count = 0
-    words = text.split()
-    for w in words:
-        current.append(w)
-        count += 1
-        if count >= max_tokens:
-            chunks.append(" ".join(current))
-            current = []
-            count = 0
-    if current:
-        chunks.append(" ".join(current))
-    return chunks
+def _read_pdf_safe(task: Tuple[str, int, int]) -> Optional[str]:
+    """
+    Process-pool worker for one page span: a corrupt PDF yields None
+    instead of killing the batch.
+    """
+    path, start, stop = task
+    try:
+        return _read_pdf(path, start, stop)
+    except Exception as e:
+        print(f"⚠ Failed to read {path}: {e}")
+        return None
+
+
+def _read_pdfs(paths: List[str]) -> List[Optional[str]]:
+    """
+    Extract the text of every PDF across worker processes. Long PDFs are
+    split into spans of _PAGES_PER_TASK pages so one big manual doesn't
+    serialize on a single worker; spans are re-joined in page order.
+    Unreadable files come back as None (a PDF without text layer as "").
+    """
+    cpus = os.cpu_count() or 1
+
+    # page counts open every file, so they run in the pool too
+    with ProcessPoolExecutor(max_workers=min(cpus, len(paths))) as ex:
+        page_counts = list(ex.map(_page_count, paths))
+
+    tasks: List[Tuple[str, int, int]] = []
+    owners: List[int] = []
+    for file_idx, (path, pages) in enumerate(zip(paths, page_counts)):
+        for start in range(0, max(pages, 1), _PAGES_PER_TASK):
+            tasks.append((path, start, start + _PAGES_PER_TASK))
+            owners.append(file_idx)
+
+    parts: List[List[Optional[str]]] = [[] for _ in paths]
+    with ProcessPoolExecutor(max_workers=min(cpus, len(tasks))) as ex:
+        # map keeps results aligned with `tasks`, i.e. in page order per file
+        for file_idx, text in zip(owners, ex.map(_read_pdf_safe, tasks)):
+            parts[file_idx].append(text)
+
+    return [None if None in spans else "\n".join(spans) for spans in parts]
+
+
+def _embed_pending(pending: List[PendingChunk]) -> None:
+    """
+    Embed chunks from all documents in a single embed_texts call (one cache
+    lookup, one length-sorted encode in EMBEDDING_BATCH_SIZE batches) and
+    attach each vector to its chunk.
+    """
+    vectors = embed_texts([c.text for c in pending])
+    for chunk, vec in zip(pending, vectors):
+        chunk.embedding = vec
+
+
+def _write_document(
+    tx: ManagedTransaction, part_id: str, fname: str, chunks: List[PendingChunk]
+) -> None:
+    doc_id = f"{part_id}:{fname}"
+    tx.run(
+        _CYPHER_UPSERT_DOCUMENT,
+        part_id=part_id,
+        doc_id=doc_id,
+        file_name=fname,
+    )
+
+    # the document's chunks in UNWIND statements of up to 1000 rows;
+    # vectors stay float32 arrays until their own batch is sent
+    for batch in iter_batches(chunks):
+        rows = [
+            {"idx": c.index, "text": c.text, "embedding": c.embedding.tolist()}
+            for c in batch
+        ]
+        tx.run(_CYPHER_UPSERT_CHUNKS, doc_id=doc_id, rows=rows)
+
+
+def _write_document_group(
+    tx: ManagedTransaction, docs: List[Tuple[str, str, List[PendingChunk]]]
+) -> None:
+    for part_id, fname, chunks in docs:
+        _write_document(tx, part_id, fname, chunks)
+
+
+def _write_documents(docs: List[Tuple[str, str, List[PendingChunk]]]) -> None:
+    """
+    Write one worker's share of documents over a single pooled session,
+    _DOCS_PER_TX documents per transaction (one commit / log flush per
+    group). A group that fails is retried document by document, so one
+    bad file doesn't drop its neighbours.
+    """
+
+    def work(session: Session) -> None:
+        for group in iter_batches(docs, _DOCS_PER_TX):
+            try:
+                session.execute_write(_write_document_group, group)
+                written = group
+            except Exception:
+                written = []
+                for part_id, fname, chunks in group:
+                    try:
+                        session.execute_write(_write_document, part_id, fname, chunks)
+                        written.append((part_id, fname, chunks))
+                    except Exception as e:
+                        print(f"⚠ Failed to ingest doc {fname} for part {part_id}: {e}")
+
+            for part_id, fname, _ in written:
+                print(f"✅ Ingested doc {fname} for part {part_id}")
+
+    with_session(work)
 
 
 def ingest_docs_for_root(root_dir: str) -> None:
@@ -43,7 +206,7 @@ def ingest_docs_for_root(root_dir: str) -> None:
         PART_ID_2/
           manual.pdf
     """
-    docs: List[Tuple[str, str, str]] = []  # (part_id, file_name, text)
+    files: List[Tuple[str, str, str]] = []  # (part_id, file_name, path)
 
     for part_dir in os.listdir(root_dir):
         part_path = os.path.join(root_dir, part_dir)
@@ -54,50 +217,44 @@ def ingest_docs_for_root(root_dir: str) -> None:
         for fname in os.listdir(part_path):
             if not fname.lower().endswith(".pdf"):
                 continue
-            fpath = os.path.join(part_path, fname)
-            try:
-                text = _read_pdf(fpath)
-            except Exception as e:
-                print(f"⚠ Failed to read {fpath}: {e}")
+            files.append((part_id, fname, os.path.join(part_path, fname)))
+
+    # PDF text extraction is CPU-bound; parse page spans on all cores
+    docs: List[Tuple[str, str, str]] = []  # (part_id, file_name, text)
+    if files:
+        texts = _read_pdfs([f[2] for f in files])
+        for (part_id, fname, path), text in zip(files, texts):
+            if text is None:
+                print(f"⚠ Skipping unreadable doc {path}")
                 continue
+            if not text.strip():
+                # still recorded as a Document, just without chunks
+                print(f"⚠ No extractable text in {path}")
             docs.append((part_id, fname, text))
 
     if not docs:
         print("No docs found for ingestion.")
         return
 
-    # Process each doc separately
+    # Chunk every doc first so short docs share embedding batches
+    # chunk on the encoder's own tokens so no chunk exceeds its window
+    tokenizer = get_model().tokenizer
+    doc_chunks: List[Tuple[str, str, List[PendingChunk]]] = []
     for part_id, fname, text in docs:
-        chunks = _chunk_text(text, max_tokens=256)
-        embeddings = embed_texts(chunks)
-
-        def work(session: Session) -> None:
-            session.run(
-                """
-                MATCH (p:Part {part_id: $part_id})
-                MERGE (d:Document {id: $doc_id})
-                SET d.file_name = $file_name
-                MERGE (p)-[:HAS_DOCUMENT]->(d)
-                """,
-                part_id=part_id,
-                doc_id=f"{part_id}:{fname}",
-                file_name=fname,
-            )
-
-            for idx, (chunk_text, emb) in enumerate(zip(chunks, embeddings)):
-                session.run(
-                    """
-                    MATCH (d:Document {id: $doc_id})
-                    MERGE (c:DocChunk {doc_id: $doc_id, chunk_index: $idx})
-                    SET c.text = $text,
-                        c.embedding = $embedding
-                    MERGE (d)-[:HAS_CHUNK]->(c)
-                    """,
-                    doc_id=f"{part_id}:{fname}",
-                    idx=idx,
-                    text=chunk_text,
-                    embedding=emb,
-                )
+        chunks = [
+            PendingChunk(part_id, fname, idx, chunk_text)
+            for idx, chunk_text in enumerate(chunk_by_tokens(text, tokenizer))
+        ]
+        doc_chunks.append((part_id, fname, chunks))
+
+    _embed_pending([c for _, _, chunks in doc_chunks for c in chunks])
+
+    # Graph writes are network-bound; each worker sends its share of the
+    # documents over one session borrowed from the shared pooled driver
+    workers = min(_WRITE_WORKERS, len(doc_chunks))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(_write_documents, [doc_chunks[i::workers] for i in range(workers)]))
 
-        run_write(work)
-        print(f"✅ Ingested doc {fname} for part {part_id}")
+    # new chunks: cached retrieval contexts are stale
+    from ..rag.semantic_cache import clear_semantic_cache
+    clear_semantic_cache()
@@ -1,9 +1,16 @@
+import hashlib
 import yaml
-from typing import Any, Dict, List, Optional
-from neo4j import Session
+from typing import IO, Any, Dict, List, Tuple, Union
+from neo4j import ManagedTransaction
 
-from ..db import run_write, run_read
-from ..embeddings import embed_text
+from ..db import iter_batches, run_write, run_read, set_embedding_cypher
+from ..embeddings import embed_texts, model_identity
+
+# libyaml's C parser when PyYAML was built against it, else pure Python
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
 
 
 
@@ -43,118 +50,156 @@ ASSEMBLY_MAP = {
 # Helpers
 
 
-def _ensure_assembly(session: Session, product_name: str, assembly_name: str):
-    """Ensure Assembly node exists and is linked to Product."""
-    session.run(
-        """
-        MERGE (a:Assembly {name: $assembly})
-        MERGE (p:Product {name: $product})
-        MERGE (p)-[:HAS_ASSEMBLY]->(a)
-        """,
-        assembly=assembly_name,
-        product=product_name,
-    )
-
-
-def _upsert_spec(session: Session, part_id: str, spec: Dict[str, Any]):
-    """Store a spec and link it to a part."""
-    key = spec.get("key")
-    value = spec.get("value")
-    unit = spec.get("unit") or ""  # FIX: ensure non-null
-    note = spec.get("note") or ""
-
-    session.run(
-        """
-        MATCH (part:Part {part_id: $part_id})
-        MERGE (s:Spec {key: $key, value: $value, unit: $unit})
-        SET s.note = $note
-        MERGE (part)-[:HAS_SPEC]->(s)
-        """,
-        part_id=part_id,
-        key=key,
-        value=value,
-        unit=unit,
-        note=note,
-    )
-
-
-def _upsert_part(
-    session: Session,
-    product_name: str,
-    part: Dict[str, Any],
-    parent_part_id: Optional[str] = None
-):
-    """Create/merge a part node, assign assembly, create children, handle specs."""
-    part_id = part["part_id"]
-    name = part.get("name")
-    category = part.get("category", "Uncategorized")
-    description = part.get("description")
-    source_url = part.get("source_url")
-
-    # Embedding for semantic search
-    emb_text = f"{name} {description or ''}"
-    embedding = embed_text(emb_text)
-
-    # 1) Create Part node
-    session.run(
-        """
-        MERGE (p:Part {part_id: $part_id})
-        SET p.name = $name,
-            p.category = $category,
-            p.description = $description,
-            p.source_url = $source_url,
-            p.embedding = $embedding,
-            p.embedding_dim = size($embedding)
-        """,
-        part_id=part_id,
-        name=name,
-        category=category,
-        description=description,
-        source_url=source_url,
-        embedding=embedding,
-    )
-
-    # 2) Attach part to parent part (HAS_CHILD)
-    if parent_part_id:
-        session.run(
-            """
-            MATCH (parent:Part {part_id: $parent}), (child:Part {part_id: $child})
-            MERGE (parent)-[:HAS_CHILD]->(child)
-            """,
-            parent=parent_part_id,
-            child=part_id,
-        )
-
-    # 3) Assign to Assembly based on category
-    assembly_name = ASSEMBLY_MAP.get(category)
-    if assembly_name:
-        _ensure_assembly(session, product_name, assembly_name)
-        session.run(
-            """
-            MATCH (a:Assembly {name: $assembly})
-            MATCH (p:Part {part_id: $part_id})
-            MERGE (p)-[:BELONGS_TO]->(a)
-            """,
-            assembly=assembly_name,
-            part_id=part_id,
+def load_yaml(stream: Union[str, bytes, IO]) -> Any:
+    """yaml.safe_load, using the C loader when available."""
+    return yaml.load(stream, Loader=_SafeLoader)
+
+
+def _part_embedding_text(part: Dict[str, Any]) -> str:
+    return f"{part.get('name')} {part.get('description') or ''}"
+
+
+def _embedding_hash(text: str) -> str:
+    """Hash of the embedded text + model; unchanged hash means reuse the stored vector."""
+    key = f"{model_identity()}\0{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _flatten_parts(parts: List[Dict[str, Any]]) -> Tuple[
+    List[Dict[str, Any]],
+    List[Dict[str, Any]],
+    List[Dict[str, Any]],
+    List[Dict[str, Any]],
+    List[Dict[str, Any]],
+]:
+    """
+    Walk the part tree iteratively (parents before children) into flat
+    row lists for UNWIND: parts, HAS_CHILD edges, distinct specs, HAS_SPEC
+    edges and BELONGS_TO assembly edges.
+    """
+    parts_rows: List[Dict[str, Any]] = []
+    edges_rows: List[Dict[str, Any]] = []
+    # (key, value, unit) -> spec row, so a spec shared by many parts is MERGEd once
+    specs: Dict[Tuple[Any, str, str], Dict[str, Any]] = {}
+    has_spec_rows: List[Dict[str, Any]] = []
+    assembly_rows: List[Dict[str, Any]] = []
+
+    stack = list(reversed(parts))
+    while stack:
+        part = stack.pop()
+        part_id = part["part_id"]
+        category = part.get("category", "Uncategorized")
+
+        parts_rows.append(
+            {
+                "part_id": part_id,
+                "name": part.get("name"),
+                "category": category,
+                "description": part.get("description"),
+                "source_url": part.get("source_url"),
+                "text": _part_embedding_text(part),
+            }
         )
 
-    # 4) Specs
-    for spec in part.get("specs", []):
-        _upsert_spec(session, part_id, spec)
-
-    # 5) Children (recursive)
-    for child in part.get("children", []):
-        _upsert_part(session, product_name, child, parent_part_id=part_id)
-
+        # Assign to Assembly based on category
+        assembly_name = ASSEMBLY_MAP.get(category)
+        if assembly_name:
+            assembly_rows.append({"part_id": part_id, "assembly": assembly_name})
+
+        for spec in part.get("specs", []):
+            key = spec.get("key")
+            value = spec.get("value")
+            unit = spec.get("unit") or ""  # FIX: ensure non-null
+            # repr keeps 24 and "24" apart (and tolerates list values)
+            specs[(key, repr(value), unit)] = {
+                "key": key,
+                "value": value,
+                "unit": unit,
+                "note": spec.get("note") or "",
+            }
+            has_spec_rows.append({"part_id": part_id, "key": key, "value": value, "unit": unit})
+
+        children = part.get("children", [])
+        for child in children:
+            edges_rows.append({"parent": part_id, "child": child["part_id"]})
+        stack.extend(reversed(children))
+
+    return parts_rows, edges_rows, list(specs.values()), has_spec_rows, assembly_rows
+
+
+
+# Cypher (module constants; set_embedding_cypher is resolved once at import)
+
+
+_CYPHER_STORED_EMB_HASHES = """
+UNWIND $ids AS pid
+MATCH (p:Part {part_id: pid})
+WHERE p.embedding IS NOT NULL
+RETURN p.part_id AS part_id, p.emb_hash AS emb_hash
+"""
+
+_CYPHER_UPSERT_PRODUCT = f"""
+MERGE (p:Product {{name: $name}})
+SET p.description = $description,
+    p.sku = $sku,
+    p.embedding_dim = size($embedding)
+{set_embedding_cypher("p", "$embedding")}
+"""
+
+_CYPHER_UPSERT_PARTS = """
+UNWIND $rows AS row
+MERGE (p:Part {part_id: row.part_id})
+SET p.name = row.name,
+    p.category = row.category,
+    p.description = row.description,
+    p.source_url = row.source_url
+"""
+
+_CYPHER_SET_PART_EMBEDDINGS = f"""
+UNWIND $rows AS row
+MATCH (p:Part {{part_id: row.part_id}})
+SET p.emb_hash = row.emb_hash,
+    p.embedding_dim = size(row.embedding)
+{set_embedding_cypher("p", "row.embedding")}
+"""
+
+_CYPHER_LINK_ASSEMBLIES = """
+MATCH (prod:Product {name: $product})
+UNWIND $rows AS row
+MATCH (p:Part {part_id: row.part_id})
+MERGE (a:Assembly {name: row.assembly})
+MERGE (prod)-[:HAS_ASSEMBLY]->(a)
+MERGE (p)-[:BELONGS_TO]->(a)
+"""
+
+_CYPHER_LINK_CHILDREN = """
+UNWIND $rows AS row
+MATCH (parent:Part {part_id: row.parent})
+MATCH (child:Part {part_id: row.child})
+MERGE (parent)-[:HAS_CHILD]->(child)
+"""
+
+_CYPHER_UPSERT_SPECS = """
+UNWIND $rows AS row
+MERGE (s:Spec {key: row.key, value: row.value, unit: row.unit})
+SET s.note = row.note
+"""
+
+_CYPHER_LINK_SPECS = """
+UNWIND $rows AS row
+MATCH (part:Part {part_id: row.part_id})
+MATCH (s:Spec {key: row.key, value: row.value, unit: row.unit})
+MERGE (part)-[:HAS_SPEC]->(s)
+"""
 
 
 # Ingest YAML Product
 
 
 def ingest_yaml_file(path: str) -> None:
-    with open(path, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    # bytes straight to the parser; libyaml detects the encoding itself
+    with open(path, "rb") as f:
+        data = load_yaml(f)
 
     product = data["product"]
     parts = data.get("parts", [])
@@ -163,28 +208,69 @@ def ingest_yaml_file(path: str) -> None:
     description = product.get("description")
     sku = product.get("sku")
 
-    # Product embedding
-    embedding = embed_text(f"{product_name} {description}")
+    parts_rows, edges_rows, specs_rows, has_spec_rows, assembly_rows = _flatten_parts(parts)
+
+    # texts/hashes stay client-side; only the changed subset is embedded
+    texts = [row.pop("text") for row in parts_rows]
+    hashes = [_embedding_hash(text) for text in texts]
 
-    def work(session: Session):
+    # Only parts whose embedded text changed since the last ingest need a vector
+    stored = run_read(_CYPHER_STORED_EMB_HASHES, {"ids": [row["part_id"] for row in parts_rows]})
+    stored_hashes = {r["part_id"]: r["emb_hash"] for r in stored}
+    changed = [
+        i for i, row in enumerate(parts_rows) if stored_hashes.get(row["part_id"]) != hashes[i]
+    ]
+
+    # Product + changed part embeddings in a single batched encode
+    vectors = embed_texts(
+        [f"{product_name} {description}"] + [texts[i] for i in changed]
+    )
+    # one C-level tolist() for the whole matrix rather than one per vector
+    vector_lists = vectors.tolist()
+    embedding = vector_lists[0]
+    embedding_rows = [
+        {"part_id": parts_rows[i]["part_id"], "emb_hash": hashes[i], "embedding": vec}
+        for i, vec in zip(changed, vector_lists[1:])
+    ]
+
+    def work(tx: ManagedTransaction):
         # Create product
-        session.run(
-            """
-            MERGE (p:Product {name: $name})
-            SET p.description = $description,
-                p.sku = $sku,
-                p.embedding = $embedding,
-                p.embedding_dim = size($embedding)
-            """,
+        tx.run(
+            _CYPHER_UPSERT_PRODUCT,
             name=product_name,
             description=description,
             sku=sku,
             embedding=embedding,
         )
 
-        # Ingest parts
-        for part in parts:
-            _upsert_part(session, product_name, part, parent_part_id=None)
+        # Parts
+        for batch in iter_batches(parts_rows):
+            tx.run(_CYPHER_UPSERT_PARTS, rows=batch)
+
+        # Embeddings, only for parts whose text changed
+        for batch in iter_batches(embedding_rows):
+            tx.run(_CYPHER_SET_PART_EMBEDDINGS, rows=batch)
+
+        # Assemblies (linked to the product) and part membership
+        for batch in iter_batches(assembly_rows):
+            tx.run(_CYPHER_LINK_ASSEMBLIES, product=product_name, rows=batch)
+
+        # Parent -> child edges
+        for batch in iter_batches(edges_rows):
+            tx.run(_CYPHER_LINK_CHILDREN, rows=batch)
+
+        # Specs: each distinct (key, value, unit) once, then the per-part edges
+        for batch in iter_batches(specs_rows):
+            tx.run(_CYPHER_UPSERT_SPECS, rows=batch)
+        for batch in iter_batches(has_spec_rows):
+            tx.run(_CYPHER_LINK_SPECS, rows=batch)
 
     run_write(work)
+
+    # parts changed: drop cached compatibility fetches and retrieval contexts
+    from ..compatibility.scoring import invalidate_product_cache
+    from ..rag.semantic_cache import clear_semantic_cache
+    invalidate_product_cache(product_name)
+    clear_semantic_cache()
+
     print(f"✅ Ingested YAML product from {path}")
@@ -0,0 +1,149 @@
+# backend/rag/common.py
+"""
+Document-chunk retrieval helpers shared by the Streamlit app and scripts:
+vector search over chunks / parts / products and prompt context blocks.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from neo4j import Result, Session
+
+# Candidate multiplier when a label filter runs after the ANN lookup, so
+# filtered-out neighbours don't leave fewer than k results.
+SCOPE_OVERFETCH = 10
+
+
+def _rows(result: Result) -> List[Dict[str, Any]]:
+    """Stream records into dicts, resolving the column names once."""
+    keys = result.keys()
+    return [dict(zip(keys, record.values())) for record in result]
+
+
+def _chunk_search_cypher(scope_filter: str) -> str:
+    return f"""
+    CALL db.index.vector.queryNodes('chunk_embedding_index', $k2, $q)
+    YIELD node, score
+    WHERE score >= $min_score
+    MATCH (node)<-[:HAS_CHUNK]-(d:Document)-[:DESCRIBES]->(x)
+    {scope_filter}
+    CALL {{
+      // specs gathered per x, not multiplied into the chunk rows
+      WITH x
+      OPTIONAL MATCH (x)-[:HAS_SPEC]->(s:Spec)
+      RETURN collect({{key:s.key, value:s.value, unit:s.unit, note:s.note}}) AS specs
+    }}
+    RETURN
+      node.text AS text,
+      score,
+      CASE WHEN x:Part THEN x.part_id ELSE coalesce(x.sku, x.name, 'PRODUCT') END AS part_id,
+      x.name AS part_name,
+      CASE WHEN x:Part THEN coalesce(x.category, 'Part') ELSE 'Product' END AS category,
+      specs,
+      d.name AS doc_name,
+      d.source AS source
+    ORDER BY score DESC
+    LIMIT $k
+    """
+
+
+# One fixed query text per scope, built once: each gets its own cached plan
+# with a plain label check instead of an OR over a $scope parameter.
+_CYPHER_SEARCH_CHUNKS = {
+    "all": _chunk_search_cypher(""),
+    "part": _chunk_search_cypher("WHERE x:Part"),
+    "product": _chunk_search_cypher("WHERE x:Product"),
+}
+
+# Part/Product embedding search; one query for both indexes, the index
+# name is a parameter.
+_CYPHER_SEARCH_NODES = """
+CALL db.index.vector.queryNodes($index, $k, $q)
+YIELD node, score
+WHERE score >= $min_score
+CALL {
+  WITH node
+  OPTIONAL MATCH (node)-[:HAS_SPEC]->(s:Spec)
+  RETURN collect({key:s.key, value:s.value, unit:s.unit, note:s.note}) AS specs
+}
+RETURN
+  coalesce(node.description,'') AS text,
+  score,
+  CASE WHEN node:Part THEN node.part_id ELSE coalesce(node.sku, node.name, 'PRODUCT') END AS part_id,
+  node.name AS part_name,
+  CASE WHEN node:Part THEN coalesce(node.category,'Part') ELSE 'Product' END AS category,
+  specs,
+  CASE WHEN node:Part THEN 'Part Description' ELSE 'Product Description' END AS doc_name,
+  CASE WHEN node:Part THEN 'part' ELSE 'product' END AS source
+ORDER BY score DESC
+LIMIT $k
+"""
+
+
+def vector_search_chunks(
+    session: Session, q_vec: Sequence[float], k: int, scope: str, min_score: float = 0.0
+) -> List[Dict[str, Any]]:
+    # min_score is a parameter; hits come back best-first, so the score cut
+    # needs no extra over-fetch (only the label filter does)
+    k2 = k if scope == "all" else k * SCOPE_OVERFETCH
+    result = session.run(
+        _CYPHER_SEARCH_CHUNKS[scope], q=q_vec, k=k, k2=k2, min_score=min_score
+    )
+    return _rows(result)
+
+
+def _vector_search_nodes(
+    session: Session, q_vec: Sequence[float], k: int, index: str, min_score: float = 0.0
+) -> List[Dict[str, Any]]:
+    result = session.run(_CYPHER_SEARCH_NODES, q=q_vec, k=k, index=index, min_score=min_score)
+    return _rows(result)
+
+
+def vector_search_parts(
+    session: Session, q_vec: Sequence[float], k: int, min_score: float = 0.0
+) -> List[Dict[str, Any]]:
+    return _vector_search_nodes(session, q_vec, k, "part_embedding_index", min_score)
+
+
+def vector_search_products(
+    session: Session, q_vec: Sequence[float], k: int, min_score: float = 0.0
+) -> List[Dict[str, Any]]:
+    """
+    Optional product fallback (requires product_embedding_index in Neo4j).
+    """
+    return _vector_search_nodes(session, q_vec, k, "product_embedding_index", min_score)
+
+
+def format_specs(specs: Optional[List[Dict[str, Any]]]) -> str:
+    if not specs:
+        return ""
+    parts = []
+    for s in specs:
+        k = s.get("key")
+        if not k:
+            continue
+        v = s.get("value") or ""
+        u = s.get("unit") or ""
+        parts.append(f"{k}={v}{u}")
+    return ", ".join(parts)
+
+
+def add_clean_text(rows: List[Dict[str, Any]]) -> None:
+    """Whitespace-collapsed `text_clean` on each row, shared by display and prompt."""
+    for r in rows:
+        r["text_clean"] = " ".join((r.get("text") or "").split())
+
+
+def build_context_block(contexts: List[Dict[str, Any]]) -> str:
+    """
+    Numbered prompt blocks (header, specs, doc, chunk text) for the LLM;
+    rows must have been through add_clean_text.
+    """
+    blocks = []
+    for i, c in enumerate(contexts, 1):
+        header = f"[{i}] {c.get('category')}: {c.get('part_name')} ({c.get('part_id')})"
+        sp = format_specs(c.get("specs"))
+        if sp:
+            header += f"\nSpecs: {sp}"
+        blocks.append(
+            f"{header}\nDoc: {c.get('doc_name')} ({c.get('source')})\nChunk: {c['text_clean']}"
+        )
+    return "\n\n".join(blocks)
@@ -1,132 +1,162 @@
 # backend/rag/retrieval.py
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 from neo4j import Session
 
-from ..db import run_read
+from ..compatibility.scoring import explanations_cypher
+from ..db import run_read, with_session
 from ..embeddings import embed_text
+from . import semantic_cache
 
+# The compatibility lookup only needs the part ids, so it runs on its own
+# pooled session while enrichment reuses the search session.
+_executor = ThreadPoolExecutor(max_workers=4)
 
-# 1. VECTOR + FULLTEXT SEARCH WITH PRODUCT / ASSEMBLY FILTERS
-
-def _search_parts(
-        question: str,
-        question_emb: List[float],
-        k: int = 5,
-        product_name: Optional[str] = None,
-        assembly_name: Optional[str] = None,
-) -> List[Dict[str, Any]]:
-    params = {
-        "embedding": question_emb,
-        "limit": k,
-        "q": question
-    }
-
-    filters = []
-
-    # Filter by product_name → Get allowed part_ids
-    if product_name:
-        rows = run_read("""
-            MATCH (prod:Product {name: $name})-[:HAS_ASSEMBLY]->(a)<-[:BELONGS_TO]-(p)
-            RETURN DISTINCT p.part_id AS pid
-        """, {"name": product_name})
+# Hybrid re-rank weight: alpha * cosine + (1 - alpha) * max-normalized fulltext score
+_RERANK_ALPHA = 0.7
 
-        allowed_ids = [r["pid"] for r in rows]
-        params["product_ids"] = allowed_ids
-        filters.append("node.part_id IN $product_ids")
-
-    # Filter by assembly_name
-    if assembly_name:
-        rows = run_read("""
-            MATCH (a:Assembly {name: $name})<-[:BELONGS_TO]-(p)
-            RETURN DISTINCT p.part_id AS pid
-        """, {"name": assembly_name})
-
-        allowed_ids = [r["pid"] for r in rows]
-        params["assembly_ids"] = allowed_ids
-        filters.append("node.part_id IN $assembly_ids")
-
-    # Build WHERE clause
-    where_clause = ""
-    if filters:
-        where_clause = "WHERE " + " AND ".join(filters)
-
-    # ----------------------
-    # 1A. VECTOR SEARCH
-    # ----------------------
-    vec_query = f"""
+# Vector + fulltext hits and the product / assembly filters in one
+# round-trip; filters are EXISTS checks evaluated per candidate.
+_CYPHER_SEARCH_PARTS = """
+CALL {
     CALL db.index.vector.queryNodes(
         'part_embedding_index',
         $limit,
         $embedding
     )
     YIELD node, score
-    {where_clause}
     RETURN node, score, 'vector' AS source
-    """
-
-    vec_rows = run_read(vec_query, params)
-
-    # ----------------------
-    # 1B. FULLTEXT SEARCH
-    # ----------------------
-    ft_query = f"""
+    UNION ALL
     CALL db.index.fulltext.queryNodes(
         'part_fulltext_idx',
         $q,
-        {{ limit: $limit }}
+        { limit: $limit }
     )
     YIELD node, score
-    {where_clause}
     RETURN node, score, 'fulltext' AS source
-    """
+}
+WITH node, score, source
+WHERE ($product IS NULL OR EXISTS {
+          MATCH (:Product {name: $product})-[:HAS_ASSEMBLY]->(:Assembly)<-[:BELONGS_TO]-(node)
+      })
+  AND ($assembly IS NULL OR EXISTS {
+          MATCH (:Assembly {name: $assembly})<-[:BELONGS_TO]-(node)
+      })
+RETURN node {.part_id, .name, .category, .description, .embedding} AS node,
+       score, source
+"""
+
+# part_id seeks hit the part_id_unique constraint's index; specs and
+# products are collected per part so they never multiply each other
+_CYPHER_ENRICH_PARTS = """
+UNWIND $part_ids AS pid
+MATCH (p:Part {part_id: pid})
+RETURN p.part_id AS part_id,
+       [(p)-[:HAS_SPEC]->(s:Spec) | {key: s.key, value: s.value, unit: s.unit}] AS specs,
+       COLLECT {
+           MATCH (prod:Product)-[:HAS_ASSEMBLY]->(:Assembly)<-[:BELONGS_TO]-(p)
+           RETURN DISTINCT prod.name
+       } AS products
+"""
+
+_CYPHER_COMPAT_FOR_PARTS = f"""
+MATCH (p:Part)-[r:COMPATIBLE_WITH]->(q:Part)
+WHERE p.part_id IN $ids AND q.part_id IN $ids
+RETURN
+    p.part_id AS from_id,
+    q.part_id AS to_id,
+    r.score AS score,
+    {explanations_cypher("r")} AS explanations
+"""
 
-    ft_rows = run_read(ft_query, params)
+
+# 1. VECTOR + FULLTEXT SEARCH WITH PRODUCT / ASSEMBLY FILTERS
+
+def _search_parts(
+        session: Session,
+        question: str,
+        question_emb: np.ndarray,
+        k: int = 5,
+        product_name: Optional[str] = None,
+        assembly_name: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    rows = run_read(_CYPHER_SEARCH_PARTS, session=session, params={
+        "embedding": question_emb.tolist(),
+        "limit": k,
+        "q": question,
+        "product": product_name or None,
+        "assembly": assembly_name or None,
+    })
 
     # ----------------------
-    # 1C. MERGE RESULTS
+    # 1C. MERGE + RE-RANK
     # ----------------------
+    # Vector and fulltext scores live on different scales, so candidates
+    # are re-scored: cosine to the question (one matvec over the returned
+    # embeddings) blended with the fulltext score normalized by its max.
     merged: Dict[str, Dict[str, Any]] = {}
+    fulltext: Dict[str, float] = {}
+    embeddings: Dict[str, Any] = {}
 
-    for row in vec_rows + ft_rows:
+    for row in rows:
         node = row["node"]
         pid = node.get("part_id")
         if not pid:
             continue
 
-        score = float(row["score"] or 0.0)
+        if row["source"] == "fulltext":
+            fulltext[pid] = max(fulltext.get(pid, 0.0), float(row["score"] or 0.0))
+
+        if pid in merged:
+            if merged[pid]["source"] != row["source"]:
+                merged[pid]["source"] = "vector+fulltext"
+            continue
+
+        merged[pid] = {
+            "part_id": pid,
+            "name": node.get("name"),
+            "category": node.get("category"),
+            "description": node.get("description"),
+            "source": row["source"],
+        }
+        embeddings[pid] = node.get("embedding")
+
+    if not merged:
+        return []
+
+    pids = list(merged)
+    cos = np.zeros(len(pids), dtype=np.float32)
+    with_emb = [i for i, pid in enumerate(pids) if embeddings[pid] is not None]
+    if with_emb:
+        C = np.asarray([embeddings[pids[i]] for i in with_emb], dtype=np.float32)
+        C /= np.maximum(np.linalg.norm(C, axis=1, keepdims=True), 1e-12)
+        cos[with_emb] = C @ np.asarray(question_emb, dtype=np.float32)
+
+    ft = np.asarray([fulltext.get(pid, 0.0) for pid in pids], dtype=np.float32)
+    if ft.max() > 0:
+        ft /= ft.max()
 
-        if pid not in merged or score > merged[pid]["score"]:
-            merged[pid] = {
-                "part_id": pid,
-                "name": node.get("name"),
-                "category": node.get("category"),
-                "description": node.get("description"),
-                "score": score,
-                "source": row["source"],
-            }
+    scores = _RERANK_ALPHA * cos + (1.0 - _RERANK_ALPHA) * ft
+    for pid, score in zip(pids, scores.tolist()):
+        merged[pid]["score"] = score
 
-    return sorted(merged.values(), key=lambda x: x["score"], reverse=True)[:k]
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [merged[pids[i]] for i in top]
 
 
 # 2. SPEC + PRODUCT ENRICHMENT
 
-def _enrich_parts_with_specs_and_products(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _enrich_parts_with_specs_and_products(
+        session: Session,
+        parts: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
     if not parts:
         return []
 
     part_ids = [p["part_id"] for p in parts]
 
-    query = """
-    MATCH (p:Part)
-    WHERE p.part_id IN $part_ids
-    OPTIONAL MATCH (p)-[:HAS_SPEC]->(s:Spec)
-    OPTIONAL MATCH (prod:Product)-[:HAS_ASSEMBLY]->(:Assembly)<-[:BELONGS_TO]-(p)
-    RETURN p.part_id AS part_id,
-           collect(DISTINCT {key: s.key, value: s.value, unit: s.unit}) AS specs,
-           collect(DISTINCT prod.name) AS products
-    """
-
-    rows = run_read(query, {"part_ids": part_ids})
+    rows = run_read(_CYPHER_ENRICH_PARTS, {"part_ids": part_ids}, session=session)
     lookup = {r["part_id"]: r for r in rows}
 
     enriched = []
@@ -146,17 +176,7 @@ def _fetch_compatibility_for_parts(part_ids: List[str]) -> Dict[str, List[Dict[s
     if not part_ids:
         return {}
 
-    query = """
-    MATCH (p:Part)-[r:COMPATIBLE_WITH]->(q:Part)
-    WHERE p.part_id IN $ids AND q.part_id IN $ids
-    RETURN 
-        p.part_id AS from_id,
-        q.part_id AS to_id,
-        r.score AS score,
-        r.explanations AS explanations
-    """
-
-    rows = run_read(query, {"ids": part_ids})
+    rows = run_read(_CYPHER_COMPAT_FOR_PARTS, {"ids": part_ids})
 
     compat: Dict[str, List[Dict[str, Any]]] = {}
     for r in rows:
@@ -180,22 +200,35 @@ def retrieve_context(
 ) -> Dict[str, Any]:
     emb = embed_text(question)
 
-    parts = _search_parts(
-        question,
-        emb,
-        k=k_parts,
-        product_name=product_name,
-        assembly_name=assembly_name,
-    )
-
-    parts = _enrich_parts_with_specs_and_products(parts)
-    part_ids = [p["part_id"] for p in parts]
-    compat = _fetch_compatibility_for_parts(part_ids)
-
-    return {
+    # paraphrase of a recent question with the same filters: reuse its context
+    scope = semantic_cache.cache_scope(k_parts, product_name, assembly_name)
+    cached = semantic_cache.lookup(scope, emb)
+    if cached is not None:
+        return {**cached, "question": question}
+
+    def work(session: Session) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+        parts = _search_parts(
+            session,
+            question,
+            emb,
+            k=k_parts,
+            product_name=product_name,
+            assembly_name=assembly_name,
+        )
+
+        part_ids = [p["part_id"] for p in parts]
+        compat_future = _executor.submit(_fetch_compatibility_for_parts, part_ids)
+        parts = _enrich_parts_with_specs_and_products(session, parts)
+        return parts, compat_future.result()
+
+    parts, compat = with_session(work)
+
+    context = {
         "question": question,
         "product_filter": product_name,
         "assembly_filter": assembly_name,
         "parts": parts,
         "compatibility": compat,
     }
+    semantic_cache.store(scope, emb, context)
+    return context
@@ -0,0 +1,193 @@
+# backend/rag/semantic_cache.py
+"""
+Semantic cache in front of retrieve_context.
+
+A question whose embedding is within SEMANTIC_CACHE_THRESHOLD cosine of a
+recently answered one (same model, k and filters) reuses that context
+instead of re-running search, enrichment and the compatibility lookup.
+Entries expire after SEMANTIC_CACHE_TTL seconds. With SEMANTIC_CACHE_PATH
+set they are also written to SQLite, so processes share hits and
+clear_semantic_cache() (bumping a generation counter there) invalidates
+every process on its next lookup. Without it the cache is per process and
+another process's clear only reaches it through the TTL.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..config import get_settings
+
+_lock = threading.Lock()
+
+# Parallel in-memory columns; row i of _matrix is the unit-norm question
+# embedding for _scopes[i] / _created[i] / _contexts[i].
+_matrix: Optional[np.ndarray] = None
+_scopes: List[str] = []
+_created: List[float] = []
+_contexts: List[Dict[str, Any]] = []
+_last_rowid = 0
+_generation = 0  # last SQLite clear generation seen by this process
+
+
+@lru_cache
+def _connect() -> sqlite3.Connection:
+    path = get_settings().SEMANTIC_CACHE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_cache "
+        "(id INTEGER PRIMARY KEY, scope TEXT NOT NULL, created REAL NOT NULL, "
+        "embedding BLOB NOT NULL, context TEXT NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_cache_meta "
+        "(id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL)"
+    )
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO semantic_cache_meta VALUES (0, 0)")
+    return conn
+
+
+def cache_scope(k_parts: int, product_name: Optional[str], assembly_name: Optional[str]) -> str:
+    """Only questions asked with the same model, k and filters may share a context."""
+    settings = get_settings()
+    return json.dumps(
+        [settings.EMBEDDING_BACKEND, settings.EMBEDDING_MODEL, k_parts, product_name, assembly_name]
+    )
+
+
+def _append(scope: str, created: float, emb: np.ndarray, context: Dict[str, Any]) -> None:
+    global _matrix
+    row = np.asarray(emb, dtype=np.float32)[None, :]
+    _matrix = row if _matrix is None else np.vstack([_matrix, row])
+    _scopes.append(scope)
+    _created.append(created)
+    _contexts.append(context)
+
+
+def _evict(now: float) -> None:
+    """Drop expired entries and trim to SEMANTIC_CACHE_SIZE (oldest first)."""
+    global _matrix, _scopes, _created, _contexts
+    settings = get_settings()
+    keep = [i for i, t in enumerate(_created) if now - t < settings.SEMANTIC_CACHE_TTL]
+    keep = keep[-settings.SEMANTIC_CACHE_SIZE :] if settings.SEMANTIC_CACHE_SIZE > 0 else []
+    if len(keep) == len(_created):
+        return
+    _matrix = _matrix[keep] if keep else None
+    _scopes = [_scopes[i] for i in keep]
+    _created = [_created[i] for i in keep]
+    _contexts = [_contexts[i] for i in keep]
+
+
+def _reset() -> None:
+    global _matrix, _scopes, _created, _contexts
+    _matrix = None
+    _scopes, _created, _contexts = [], [], []
+
+
+def _sync(now: float) -> None:
+    """
+    Pull unexpired entries written to SQLite (by any process) since the last
+    sync; drop everything held in memory if some process cleared the cache.
+    """
+    global _last_rowid, _generation
+    conn = _connect()
+    generation = conn.execute(
+        "SELECT generation FROM semantic_cache_meta WHERE id = 0"
+    ).fetchone()[0]
+    if generation != _generation:
+        _reset()
+        _generation, _last_rowid = generation, 0
+
+    rows = conn.execute(
+        "SELECT id, scope, created, embedding, context FROM semantic_cache "
+        "WHERE id > ? AND created > ? ORDER BY id",
+        (_last_rowid, now - get_settings().SEMANTIC_CACHE_TTL),
+    ).fetchall()
+    for rowid, scope, created, blob, context in rows:
+        _append(scope, created, np.frombuffer(blob, dtype=np.float32), json.loads(context))
+        _last_rowid = rowid
+
+
+def lookup(scope: str, emb: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Cached context of the most similar question in `scope`, if close enough."""
+    settings = get_settings()
+    if settings.SEMANTIC_CACHE_TTL <= 0 or settings.SEMANTIC_CACHE_SIZE <= 0:
+        return None
+
+    now = time.time()
+    with _lock:
+        if settings.SEMANTIC_CACHE_PATH:
+            _sync(now)
+        _evict(now)
+        if _matrix is None:
+            return None
+
+        sims = _matrix @ np.asarray(emb, dtype=np.float32)
+        sims[np.array([s != scope for s in _scopes])] = -np.inf
+        best = int(np.argmax(sims))
+        if sims[best] >= settings.SEMANTIC_CACHE_THRESHOLD:
+            # a copy, so callers mutating the context can't corrupt the cache
+            return copy.deepcopy(_contexts[best])
+    return None
+
+
+def store(scope: str, emb: np.ndarray, context: Dict[str, Any]) -> None:
+    settings = get_settings()
+    if settings.SEMANTIC_CACHE_TTL <= 0 or settings.SEMANTIC_CACHE_SIZE <= 0:
+        return
+
+    now = time.time()
+    with _lock:
+        if settings.SEMANTIC_CACHE_PATH:
+            # picked up by the next _sync, here and in other processes
+            conn = _connect()
+            with conn:
+                # the newest row is kept so rowids (the _sync cursor) never restart
+                conn.execute(
+                    "DELETE FROM semantic_cache WHERE created <= ? "
+                    "AND id < (SELECT MAX(id) FROM semantic_cache)",
+                    (now - settings.SEMANTIC_CACHE_TTL,),
+                )
+                conn.execute(
+                    "INSERT INTO semantic_cache (scope, created, embedding, context) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        scope,
+                        now,
+                        np.asarray(emb, dtype=np.float32).tobytes(),
+                        json.dumps(context, default=str),
+                    ),
+                )
+        else:
+            _append(scope, now, emb, copy.deepcopy(context))
+
+
+def clear_semantic_cache() -> None:
+    """
+    Forget every cached context (e.g. after ingestion). With SQLite this
+    also bumps the generation, so other processes drop theirs on next lookup.
+    """
+    global _last_rowid, _generation
+    with _lock:
+        if get_settings().SEMANTIC_CACHE_PATH:
+            conn = _connect()
+            with conn:
+                conn.execute("DELETE FROM semantic_cache")
+                conn.execute(
+                    "UPDATE semantic_cache_meta SET generation = generation + 1 WHERE id = 0"
+                )
+                _generation = conn.execute(
+                    "SELECT generation FROM semantic_cache_meta WHERE id = 0"
+                ).fetchone()[0]
+            _last_rowid = 0
+        _reset()
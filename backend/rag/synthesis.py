@@ -1,38 +1,66 @@
 # backend/rag/synthesis.py
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
 import textwrap
 
+import httpx
 from groq import Groq
 
 from ..config import get_settings
 
 
-def _format_context(context: Dict[str, Any]) -> str:
-    lines = []
-    for p in context.get("parts", []):
-        lines.append(f"Part: {p.get('part_id')} - {p.get('name')}")
-        lines.append(f"  Category: {p.get('category')}")
-        lines.append(f"  Description: {p.get('description')}")
-        lines.append("  Specs:")
-        for s in p.get("specs", []):
-            lines.append(f"    - {s.get('key')} = {s.get('value')}{s.get('unit','')}")
-        lines.append(f"  Products: {', '.join(p.get('products', []))}")
-        lines.append("")
+@lru_cache(maxsize=1)
+def get_groq_client() -> Groq:
+    """One Groq client per process, with a keep-alive pool (no TLS handshake per call)."""
+    return Groq(
+        api_key=get_settings().GROQ_API_KEY,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=30)
+        ),
+    )
 
-    compat = context.get("compatibility", {})
-    if compat:
-        lines.append("Compatibility relationships among retrieved parts:")
-        for from_id, lst in compat.items():
-            for rel in lst:
-                lines.append(
-                    f"  {from_id} ↔ {rel['to_id']}: score={rel['score']:.2f}, "
-                    f"reasons={'; '.join(rel.get('explanations', []))}"
-                )
 
-    return "\n".join(lines)
+def _format_part(p: Dict[str, Any]) -> str:
+    specs = "\n".join(
+        f"    - {s.get('key')} = {s.get('value')}{s.get('unit', '')}"
+        for s in p.get("specs", [])
+    )
+    return (
+        f"Part: {p.get('part_id')} - {p.get('name')}\n"
+        f"  Category: {p.get('category')}\n"
+        f"  Description: {p.get('description')}\n"
+        f"  Specs:\n"
+        + (specs + "\n" if specs else "")
+        + f"  Products: {', '.join(p.get('products', []))}\n"
+    )
+
 
+def _format_context(context: Dict[str, Any]) -> str:
+    blobs = [_format_part(p) for p in context.get("parts", [])]
 
-def synthesize_answer(question: str, context: Dict[str, Any]) -> str:
+    compat = context.get("compatibility", {})
+    if compat:
+        blobs.append("Compatibility relationships among retrieved parts:")
+        blobs.extend(
+            f"  {from_id} ↔ {rel['to_id']}: score={rel['score']:.2f}, "
+            f"reasons={'; '.join(rel.get('explanations', []))}"
+            for from_id, lst in compat.items()
+            for rel in lst
+        )
+
+    return "\n".join(blobs)
+
+
+def synthesize_answer(
+    question: str,
+    context: Dict[str, Any],
+    on_token: Optional[Callable[[str], None]] = None,
+) -> str:
+    """
+    Answer `question` from the retrieved context. With `on_token`, the
+    completion is streamed and each text delta is passed to it as it
+    arrives; the full answer is still returned.
+    """
     settings = get_settings()
     if not settings.GROQ_API_KEY:
         # fallback: just show context
@@ -48,7 +76,7 @@ def synthesize_answer(question: str, context: Dict[str, Any]) -> str:
             """
         ).strip()
 
-    client = Groq(api_key=settings.GROQ_API_KEY)
+    client = get_groq_client()
 
     system_prompt = textwrap.dedent(
         """
@@ -76,12 +104,28 @@ def synthesize_answer(question: str, context: Dict[str, Any]) -> str:
         """
     )
 
-    resp = client.chat.completions.create(
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    if on_token is None:
+        resp = client.chat.completions.create(
+            model=settings.GROQ_CHAT_MODEL,
+            messages=messages,
+            temperature=0.3,
+        )
+        return resp.choices[0].message.content.strip()
+
+    stream = client.chat.completions.create(
         model=settings.GROQ_CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+        messages=messages,
         temperature=0.3,
+        stream=True,
     )
-    return resp.choices[0].message.content.strip()
+    pieces = []
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            pieces.append(delta)
+            on_token(delta)
+    return "".join(pieces).strip()
@@ -18,6 +18,20 @@ CREATE CONSTRAINT part_id_unique IF NOT EXISTS
 FOR (p:Part)
 REQUIRE p.part_id IS UNIQUE;
 
+// Each Assembly must have a unique name (assemblies are shared across products).
+CREATE CONSTRAINT assembly_name_unique IF NOT EXISTS
+FOR (a:Assembly)
+REQUIRE a.name IS UNIQUE;
+
+// Documents and their chunks are MERGEd on these keys during doc ingestion.
+CREATE CONSTRAINT document_id_unique IF NOT EXISTS
+FOR (d:Document)
+REQUIRE d.id IS UNIQUE;
+
+CREATE CONSTRAINT doc_chunk_unique IF NOT EXISTS
+FOR (c:DocChunk)
+REQUIRE (c.doc_id, c.chunk_index) IS UNIQUE;
+
 // Each Spec (key,value,unit) combination must be unique.
 // NODE KEY enforces uniqueness AND existence.
 CREATE CONSTRAINT spec_identity IF NOT EXISTS
@@ -73,6 +87,8 @@ ON (p.embedding_dim);
 // These are required for the RAG retrieval engine.
 // They must match your embedding model dimension (384 = gte-small).
 // Neo4j 5 supports vector indexes natively.
+// Ingestion stores unit-normalized vectors (backend.embeddings.embed_texts),
+// so cosine here reduces to a dot product.
 //
 
 // Part-level semantic index
@@ -96,3 +112,14 @@ OPTIONS {
     `vector.similarity_function`: "cosine"
   }
 };
+
+// Document-chunk semantic index (chunk search in app/streamlit_app.py)
+CREATE VECTOR INDEX chunk_embedding_index IF NOT EXISTS
+FOR (c:Chunk)
+ON (c.embedding)
+OPTIONS {
+  indexConfig: {
+    `vector.dimensions`: 384,
+    `vector.similarity_function`: "cosine"
+  }
+};
@@ -11,25 +11,19 @@ def load_env():
     }
 
 def cross_compare(driver):
+    # match + link in one statement; no per-pair round-trips
     with driver.session() as s:
-        pairs = s.run("""
+        created = s.run("""
             MATCH (p1:Product)-[:HAS_MODULE]->(m1:Module),
                   (p2:Product)-[:HAS_MODULE]->(m2:Module)
             WHERE toLower(p1.name) CONTAINS 'modulathe v1'
               AND toLower(p2.name) CONTAINS 'modulathe v2'
-            RETURN DISTINCT m1.name AS v1, m2.name AS v2
-        """)
-        created = 0
-        for rec in pairs:
-            v1, v2 = rec["v1"], rec["v2"]
-            if v1 and v2:
-                if v1.lower() == v2.lower():
-                    s.run("""
-                        MATCH (m1:Module {name:$v1}), (m2:Module {name:$v2})
-                        MERGE (m1)-[r:CROSS_VERSION_COMPATIBLE_WITH]->(m2)
-                        SET r.score=0.9, r.reason='same module name'
-                    """, v1=v1, v2=v2)
-                    created += 1
+              AND toLower(m1.name) = toLower(m2.name)
+            WITH DISTINCT m1, m2
+            MERGE (m1)-[r:CROSS_VERSION_COMPATIBLE_WITH]->(m2)
+            SET r.score=0.9, r.reason='same module name'
+            RETURN count(*) AS created
+        """).single()["created"]
         print(f"✅ created {created} cross-version links")
 
 if __name__ == "__main__":
@@ -1,10 +1,32 @@
 """
 Re-ingests Modulathe README markdowns (v1,v2) and ensures text chunks are embedded.
 """
-import os, re
+import os, re, sys
+from pathlib import Path
+import numpy as np
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))  # repo root, for `backend`
+from backend.config import get_settings
+from backend.db import iter_batches
+from backend.embeddings import chunk_by_tokens, get_model
+from backend.embeddings_cache import get_or_embed
+
+_TITLE_RE = re.compile(r"#\s*(.+)")
+_MODULE_RE = re.compile(r"###\s+([A-Za-z0-9\s\-_]+)")
+
+# MERGE keys used below; without them every MERGE is a label scan
+SCHEMA = [
+    "CREATE CONSTRAINT product_name_unique IF NOT EXISTS FOR (p:Product) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT module_name_unique IF NOT EXISTS FOR (m:Module) REQUIRE m.name IS UNIQUE",
+    "CREATE CONSTRAINT chunk_id_unique IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE",
+    "CREATE INDEX document_title_idx IF NOT EXISTS FOR (d:Document) ON (d.title)",
+    # ANN index the chunk search (app/streamlit_app.py) queries
+    "CREATE VECTOR INDEX chunk_embedding_index IF NOT EXISTS FOR (c:Chunk) ON (c.embedding) "
+    f"OPTIONS {{indexConfig: {{`vector.dimensions`: {get_settings().EMBEDDING_DIM}, "
+    "`vector.similarity_function`: 'cosine'}}",
+]
 
 def load_env():
     load_dotenv()
@@ -17,67 +39,99 @@ def load_env():
 def parse_markdown(path):
     with open(path, "r", encoding="utf-8") as f:
         text = f.read()
-    title = re.findall(r"#\s*(.+)", text)
-    product = title[0].strip() if title else os.path.basename(path)
-    modules = re.findall(r"###\s+([A-Za-z0-9\s\-_]+)", text)
+    title = _TITLE_RE.search(text)  # first heading only; no full-text findall
+    product = title.group(1).strip() if title else os.path.basename(path)
+    modules = _MODULE_RE.findall(text)
     return product, modules, text
 
-def chunk_text(t, size=900, overlap=100):
+def get_embedder():
     """
-    Split text into manageable overlapping chunks.
-    Ensures progress even for very large documents.
+    The backend's shared encoder (backend.embeddings.get_model): honours
+    EMBEDDING_BACKEND / EMBEDDING_ONNX_PATH / EMBEDDING_NUM_THREADS from
+    Settings, sentence-transformers or the int8 ONNX export.
     """
-    t = t.strip()
-    if not t:
-        return []
-    chunks = []
-    n = len(t)
-    start = 0
-    while start < n:
-        end = min(n, start + size)
-        chunks.append(t[start:end])
-        if end >= n:
-            break
-        # move forward by size - overlap
-        start += max(size - overlap, 1)
-    return chunks
+    return get_model()
 
-def ingest(driver, embedder, file):
-    product, modules, text = parse_markdown(file)
-    emb = embedder.encode([text], normalize_embeddings=True)[0].tolist()
-    chunks = chunk_text(text)
-    vecs = embedder.encode(chunks, normalize_embeddings=True)
+def embed_all(embedder, texts):
+    """
+    One encode pass over every text, sorted by length so each batch pads
+    only to its own longest text; rows come back in input order. Texts
+    already in the shared SQLite embedding cache (EMBEDDING_CACHE_PATH)
+    are not re-encoded.
+    """
+    def encode(batch):
+        order = np.argsort([len(t) for t in batch], kind="stable")
+        vecs = embedder.encode([batch[i] for i in order], batch_size=64,
+                               normalize_embeddings=True, convert_to_numpy=True)
+        out = np.empty_like(vecs)
+        out[order] = vecs
+        return out
 
-    with driver.session() as s:
-        s.run("""
-            MERGE (p:Product {name:$name})
-            SET p.source='modulathe', p.embedding=$emb
-        """, name=product, emb=emb)
-        for m in modules:
-            s.run("""
-                MATCH (p:Product {name:$prod})
-                MERGE (m:Module {name:$m})
-                MERGE (p)-[:HAS_MODULE]->(m)
-            """, prod=product, m=m)
-        for i,(txt,v) in enumerate(zip(chunks,vecs)):
-            s.run("""
-                MATCH (p:Product {name:$prod})
-                MERGE (d:Document {title:$title})
-                MERGE (p)-[:REFERENCED_IN]->(d)
-                CREATE (c:Chunk {id:$id, text:$txt, embedding:$emb})
-                MERGE (d)-[:HAS_CHUNK]->(c)
-            """, prod=product, title=f"{product}-README",
-                 id=f"{product}-chunk-{i}", txt=txt, emb=v.tolist())
+    if get_settings().EMBEDDING_CACHE_PATH:
+        return get_or_embed(texts, encode)
+    return encode(texts)
+
+def ensure_schema(session):
+    for stmt in SCHEMA:
+        try:
+            session.run(stmt).consume()
+        except Exception as e:
+            print(f"⚠️ schema: {e}")
+
+def _write_product(tx, product, modules, chunks, emb, vecs):
+    tx.run("""
+        MERGE (p:Product {name:$name})
+        SET p.source='modulathe', p.embedding=$emb
+    """, name=product, emb=emb)
+    tx.run("""
+        MATCH (p:Product {name:$prod})
+        UNWIND $modules AS m
+        MERGE (mod:Module {name:m})
+        MERGE (p)-[:HAS_MODULE]->(mod)
+    """, prod=product, modules=modules)
+    rows = [{"id": f"{product}-chunk-{i}", "txt": txt, "emb": v}
+            for i, (txt, v) in enumerate(zip(chunks, vecs.tolist()))]
+    for batch in iter_batches(rows):  # db.WRITE_BATCH_SIZE rows per UNWIND
+        tx.run("""
+            MATCH (p:Product {name:$prod})
+            MERGE (d:Document {title:$title})
+            MERGE (p)-[:REFERENCED_IN]->(d)
+            WITH d
+            UNWIND $rows AS row
+            MERGE (c:Chunk {id:row.id})
+            SET c.text=row.txt, c.embedding=row.emb
+            MERGE (d)-[:HAS_CHUNK]->(c)
+        """, prod=product, title=f"{product}-README",
+             rows=batch)
+
+def ingest(session, product, modules, chunks, emb, vecs):
+    # one transaction (one commit) per file
+    session.execute_write(_write_product, product, modules, chunks, emb, vecs)
     print(f"✅ Ingested {product} with {len(modules)} modules and {len(chunks)} chunks")
 
 def main():
     env = load_env()
     driver = GraphDatabase.driver(env["NEO4J_URI"],
         auth=(env["NEO4J_USER"], env["NEO4J_PASSWORD"]))
-    embedder = SentenceTransformer("thenlper/gte-small")
+    embedder = get_embedder()
+    docs = []
     for f in ["data/modulathe_v1.md", "data/modulathe_v2.md"]:
-        if os.path.exists(f): ingest(driver, embedder, f)
+        if os.path.exists(f):
+            product, modules, text = parse_markdown(f)
+            # token windows from the encoder's tokenizer, not character counts
+            docs.append((product, modules, text, chunk_by_tokens(text.strip(), embedder.tokenizer)))
         else: print(f"⚠️ missing {f}")
+
+    # full texts + all chunks of every file in a single embedding pass
+    texts = [t for _, _, text, chunks in docs for t in [text] + chunks]
+    vecs = embed_all(embedder, texts) if texts else []
+    offset = 0
+    with driver.session() as session:
+        ensure_schema(session)
+        for product, modules, _, chunks in docs:
+            emb = vecs[offset].tolist()
+            ingest(session, product, modules, chunks, emb, vecs[offset + 1:offset + 1 + len(chunks)])
+            offset += 1 + len(chunks)
     driver.close()
 
 if __name__ == "__main__":
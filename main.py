@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, HTTPException, UploadFile, File
@@ -5,20 +7,24 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from backend.rag.retrieval import retrieve_context
-from backend.rag.synthesis import synthesize_answer
-from backend.db import run_read
+from backend.rag.synthesis import get_groq_client, synthesize_answer
+from backend.db import close_driver, get_driver, run_read
 from backend.compatibility.scoring import (
     compute_compatibility_for_new_part,
+    explanations_cypher,
 )
 from backend.config import get_settings
 
-try:
-    from groq import Groq
-except ImportError:
-    Groq = None
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the Bolt pool (and apply constraints) once at startup, not on the
+    # first request; every endpoint then borrows connections from it.
+    await asyncio.to_thread(get_driver)
+    yield
+    close_driver()
 
 
-app = FastAPI(title="Asset Intelligence Graph-RAG API")
+app = FastAPI(title="Asset Intelligence Graph-RAG API", lifespan=lifespan)
 
 # CORS (adjust as needed)
 app.add_middleware(
@@ -54,6 +60,7 @@ class NewPartCompatRequest(BaseModel):
     specs: Optional[Dict[str, NewPartSpec]] = None
     assembly_hint: Optional[str] = None
     top_k: int = 10
+    explain: bool = False
 
 
 # Health & Products
@@ -92,13 +99,15 @@ def api_graph(product_name: str):
 
 # Graph-RAG Query
 @app.post("/api/query", response_model=QueryResponse)
-def api_query(req: QueryRequest):
-    ctx = retrieve_context(
+async def api_query(req: QueryRequest):
+    # Embedding, Neo4j and Groq calls block; run them off the event loop
+    ctx = await asyncio.to_thread(
+        retrieve_context,
         req.question,
         k_parts=req.k_parts,
         product_name=req.product_name,
     )
-    answer = synthesize_answer(req.question, ctx)
+    answer = await asyncio.to_thread(synthesize_answer, req.question, ctx)
     return QueryResponse(answer=answer, context=ctx)
 
 
@@ -110,8 +119,8 @@ def api_compat_for_product(product_name: str, limit: int = 200):
     We assume scripts.compat has already been run for this product.
     """
     rows = run_read(
-        """
-        MATCH (prod:Product {name: $name})-[:HAS_ASSEMBLY]->(a:Assembly)
+        f"""
+        MATCH (prod:Product {{name: $name}})-[:HAS_ASSEMBLY]->(a:Assembly)
               <-[:BELONGS_TO]-(p:Part)
         MATCH (p)-[r:COMPATIBLE_WITH]->(q:Part)-[:BELONGS_TO]->(a2:Assembly)
               <-[:HAS_ASSEMBLY]-(prod)
@@ -125,7 +134,7 @@ def api_compat_for_product(product_name: str, limit: int = 200):
                r.functional AS functional,
                r.semantic AS semantic,
                r.hierarchy AS hierarchy,
-               r.explanations AS explanations
+               {explanations_cypher("r")} AS explanations
         ORDER BY score DESC
         LIMIT $limit
         """,
@@ -151,6 +160,7 @@ def api_new_part_compat(req: NewPartCompatRequest):
         specs=specs_typed,
         assembly_hint=req.assembly_hint,
         top_k=req.top_k,
+        explain=req.explain,
     )
     return {"results": results}
 
@@ -160,9 +170,9 @@ def api_new_part_compat(req: NewPartCompatRequest):
 async def api_ingest_yaml(file: UploadFile = File(...)):
     data = await file.read()
 
-    import yaml
+    from backend.ingestion.yaml_ingestor import load_yaml
     try:
-        parsed = yaml.safe_load(data)
+        parsed = load_yaml(data)
         if "product" not in parsed:
             raise ValueError("Missing 'product' block")
         if "parts" not in parsed:
@@ -177,7 +187,7 @@ async def api_ingest_yaml(file: UploadFile = File(...)):
 
     # Run ingest
     from backend.ingestion.yaml_ingestor import ingest_yaml_file
-    ingest_yaml_file(path)
+    await asyncio.to_thread(ingest_yaml_file, path)
 
     return {"status": "ingested", "product": parsed["product"]["name"]}
 
@@ -190,7 +200,7 @@ async def api_stt(file: UploadFile = File(...)):
     Uses Groq Whisper if configured.
     """
     settings = get_settings()
-    if not settings.GROQ_API_KEY or Groq is None:
+    if not settings.GROQ_API_KEY:
         raise HTTPException(
             status_code=500,
             detail="STT not configured (missing GROQ_API_KEY or groq client).",
@@ -198,9 +208,10 @@ async def api_stt(file: UploadFile = File(...)):
 
     audio_bytes = await file.read()
 
-    client = Groq(api_key=settings.GROQ_API_KEY)
+    client = get_groq_client()
     try:
-        transcription = client.audio.transcriptions.create(
+        transcription = await asyncio.to_thread(
+            client.audio.transcriptions.create,
             model="whisper-large-v3",
             file=("audio.webm", audio_bytes),
             # or use: file=audio_bytes and mime_type="audio/webm"
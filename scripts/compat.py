@@ -1,14 +1,24 @@
 # scripts/compat.py
 import argparse
+import logging
 from backend.compatibility.scoring import compute_compatibility_for_product
 
 
 def main():
     parser = argparse.ArgumentParser(description="Compute compatibility for a product")
     parser.add_argument("--product", required=True, help="Product name in Neo4j")
+    parser.add_argument(
+        "--explain", action="store_true", help="Also store human-readable explanations"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Log every scored pair"
+    )
     args = parser.parse_args()
 
-    compute_compatibility_for_product(args.product)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s"
+    )
+    compute_compatibility_for_product(args.product, explain=args.explain)
 
 
 if __name__ == "__main__":
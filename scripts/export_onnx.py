@@ -0,0 +1,39 @@
+# scripts/export_onnx.py
+import argparse
+import os
+
+from backend.config import get_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the embedding model to ONNX (+ dynamic int8 quantization)"
+    )
+    parser.add_argument("--out", help="Output dir (default: EMBEDDING_ONNX_PATH)")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep FP32 weights only")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    out_dir = args.out or settings.EMBEDDING_ONNX_PATH
+
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    model = ORTModelForFeatureExtraction.from_pretrained(settings.EMBEDDING_MODEL, export=True)
+    model.save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL).save_pretrained(out_dir)
+
+    if not args.no_quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            os.path.join(out_dir, "model.onnx"),
+            os.path.join(out_dir, "model_quantized.onnx"),
+            weight_type=QuantType.QInt8,
+        )
+
+    print(f"✅ Exported {settings.EMBEDDING_MODEL} to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
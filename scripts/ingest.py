@@ -1,14 +1,59 @@
 # scripts/ingest.py
 import argparse
+import glob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from backend.embeddings import get_model
 from backend.ingestion.yaml_ingestor import ingest_yaml_file
 
 
+def ingest_files(paths, workers: int = 8, processes: bool = False) -> None:
+    """
+    Ingest several YAML files concurrently. Each worker thread uses its own
+    pooled driver session, so one file's graph writes overlap another's
+    embedding pass (the encoder releases the GIL).
+
+    With processes=True each worker is a separate process with its own
+    encoder and driver, sharding the embedding cost across CPU cores.
+    """
+    if len(paths) == 1:
+        ingest_yaml_file(paths[0])
+        return
+
+    if processes:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        get_model()  # load the encoder once before the workers share it
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    with pool as ex:
+        futures = [ex.submit(ingest_yaml_file, path) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠ Failed to ingest {path}: {e}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Ingest product YAML into Neo4j")
-    parser.add_argument("--file", required=True, help="Path to YAML file")
+    parser.add_argument("--file", nargs="+", default=[], help="Path(s) to YAML file(s)")
+    parser.add_argument("--data-glob", help='Glob of YAML files, e.g. "data/*.yaml"')
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent ingest workers")
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="One process (encoder + driver) per worker instead of threads",
+    )
     args = parser.parse_args()
 
-    ingest_yaml_file(args.file)
+    paths = list(args.file)
+    if args.data_glob:
+        paths += sorted(glob.glob(args.data_glob, recursive=True))
+    if not paths:
+        parser.error("no input: pass --file and/or a --data-glob that matches")
+
+    ingest_files(paths, workers=args.workers, processes=args.processes)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 # scripts/rag_cli.py
 import argparse
+import sys
 
 from backend.rag.retrieval import retrieve_context
 from backend.rag.synthesis import synthesize_answer
@@ -9,13 +10,29 @@ def main():
     parser = argparse.ArgumentParser(description="Graph-RAG CLI")
     parser.add_argument("--question", required=True, help="Your question")
     parser.add_argument("--k_parts", type=int, default=5)
+    parser.add_argument(
+        "--stream", action="store_true", help="Print the answer as it is generated"
+    )
     args = parser.parse_args()
 
     ctx = retrieve_context(args.question, k_parts=args.k_parts)
-    answer = synthesize_answer(args.question, ctx)
 
     print("=== Answer ===")
-    print(answer)
+    if args.stream:
+        streamed = []
+
+        def on_token(delta: str) -> None:
+            streamed.append(delta)
+            sys.stdout.write(delta)
+            sys.stdout.flush()
+
+        answer = synthesize_answer(args.question, ctx, on_token=on_token)
+        if streamed:
+            print()
+        else:  # no LLM configured: nothing was streamed
+            print(answer)
+    else:
+        print(synthesize_answer(args.question, ctx))
     print("\n=== Raw Context ===")
     print(ctx)
 